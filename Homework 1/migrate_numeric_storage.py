@@ -0,0 +1,95 @@
+import sqlite3
+import sys
+from updated_homework import DB_NAME, bump_data_version
+
+CHUNK_SIZE=5000 #rows converted and committed at a time
+MIGRATION_NAME='numeric_storage'
+PRICE_COLUMNS=('last_trade_price', 'max', 'min')
+INTEGER_COLUMNS=('volume', 'turnover_best')
+
+# Older scraper runs stored the Macedonian format (1.234,56) as text, these helpers turn it into numbers
+def parse_legacy_number(value, integer=False):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            number = float(value.strip().replace('.', '').replace(',', '.'))
+        except ValueError:
+            return None
+        return int(number) if integer else number
+    if integer and isinstance(value, float) and not value.is_integer():
+        # SQLite's INTEGER affinity turned '49.265' into the REAL 49.265, the dot was a thousands separator.
+        # A value like '12.000' already became the INTEGER 12 and can't be told apart, it is left as is.
+        return int(round(value * 1000))
+    return value
+
+def create_migration_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS migration_state(
+        name TEXT PRIMARY KEY,
+        last_rowid INTEGER,
+        done INTEGER DEFAULT 0
+    )
+    ''')
+    conn.commit()
+
+def get_progress(conn):
+    row = conn.execute('SELECT last_rowid, done FROM migration_state WHERE name = ?', (MIGRATION_NAME,)).fetchone()
+    return (row[0], bool(row[1])) if row else (0, False)
+
+def convert_row(row):
+    prices = [parse_legacy_number(value) for value in row[1:4]]
+    integers = [parse_legacy_number(value, integer=True) for value in row[4:6]]
+    return prices + integers
+
+def migrate(db_name=DB_NAME, chunk_size=CHUNK_SIZE):
+    """Convert the text columns of transactions to REAL/INTEGER in place.
+    Every chunk is committed together with its progress, so an interrupted run
+    continues where it stopped and a finished one is a no-op."""
+    conn = sqlite3.connect(db_name)
+    create_migration_table(conn)
+    last_rowid, done = get_progress(conn)
+    if done:
+        print("Migration already finished")
+        conn.close()
+        return 0
+    # the API's caches and the columnar store are keyed on data_version, converted issuers need a new one
+    has_ingest_state = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ingest_state'").fetchone() is not None
+    converted = 0
+    while True:
+        rows = conn.execute('''
+        SELECT rowid, last_trade_price, max, min, volume, turnover_best, issuer
+        FROM transactions WHERE rowid > ? ORDER BY rowid LIMIT ?
+        ''', (last_rowid, chunk_size)).fetchall()
+        if not rows:
+            break
+        updates = []
+        changed_issuers = set()
+        for row in rows:
+            values = convert_row(row)
+            if values != list(row[1:6]):
+                updates.append(values + [row[0]])
+                changed_issuers.add(row[6])
+        last_rowid = rows[-1][0]
+        with conn: #one transaction for the chunk, its data versions and its progress
+            conn.executemany('''
+            UPDATE transactions SET last_trade_price = ?, max = ?, min = ?, volume = ?, turnover_best = ?
+            WHERE rowid = ?
+            ''', updates)
+            if has_ingest_state:
+                for issuer in changed_issuers:
+                    bump_data_version(conn, issuer)
+            conn.execute('INSERT OR REPLACE INTO migration_state (name, last_rowid, done) VALUES (?, ?, 0)',
+                         (MIGRATION_NAME, last_rowid))
+        converted+=len(updates)
+        print("Converted up to row ", last_rowid)
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO migration_state (name, last_rowid, done) VALUES (?, ?, 1)',
+                     (MIGRATION_NAME, last_rowid))
+    conn.close()
+    return converted
+
+if __name__ == '__main__':
+    # usage: python migrate_numeric_storage.py [database file]
+    converted = migrate(sys.argv[1] if len(sys.argv) > 1 else DB_NAME)
+    print("Number of rows converted ", converted)
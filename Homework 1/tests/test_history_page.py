@@ -0,0 +1,39 @@
+import datetime
+import os
+import pytest
+import updated_homework as scraper
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# the rows every history_* fixture holds, as parse_history_page writes them
+EXPECTED_ROWS = [
+    ['ALK', datetime.date(2026, 10, 16), 21350.0, 21400.0, 21100.0, 1032, 21980713],
+    ['ALK', datetime.date(2026, 10, 15), 21250.0, 21300.0, 21000.0, 547, 11599540],
+    ['ALK', datetime.date(2026, 10, 14), 21300.0, 21300.0, 21300.0, None, None],
+]
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+@pytest.mark.parametrize('extractor', sorted(scraper.TABLE_EXTRACTORS))
+@pytest.mark.parametrize('page', ['history_closed_tags.html', 'history_unclosed_tags.html',
+                                  'history_short_rows.html', 'table_only.html'])
+def test_parse_history_page(page, extractor):
+    assert scraper.parse_history_page(read_fixture(page), 'ALK', extractor) == EXPECTED_ROWS
+
+@pytest.mark.parametrize('page', sorted(name for name in os.listdir(FIXTURES) if name.endswith('.html')))
+def test_extractors_agree(page):
+    page_html = read_fixture(page)
+    tables = {name: extractor(page_html) for name, extractor in scraper.TABLE_EXTRACTORS.items()}
+    assert all(table == tables['bs4'] for table in tables.values()), tables
+
+@pytest.mark.parametrize('extractor', sorted(scraper.TABLE_EXTRACTORS))
+def test_multiline_cell_stays_in_its_column(extractor):
+    # 21,400<br>.00 can't be parsed, but the cells after it must still land in their own columns and rows
+    rows = scraper.parse_history_page(read_fixture('history_multiline_cell.html'), 'ALK', extractor)
+    assert rows == [EXPECTED_ROWS[0][:3] + [None] + EXPECTED_ROWS[0][4:]] + EXPECTED_ROWS[1:]
+
+@pytest.mark.parametrize('extractor', sorted(scraper.TABLE_EXTRACTORS))
+def test_page_without_table(extractor):
+    assert scraper.parse_history_page(read_fixture('history_no_table.html'), 'ALK', extractor) == []
@@ -1,9 +1,26 @@
 import datetime
+import html
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 
 DB_NAME="updated_stocks_database.db"
+MAX_WORKERS=8 #concurrent requests in flight, set to 1 for the old sequential behaviour
+REQUESTS_PER_SECOND=10 #per host, so we don't get throttled by mse.mk
+BATCH_SIZE=1000 #rows per commit in the streaming writer
+QUEUE_SIZE=32 #fetched windows waiting for the writer, bounds memory use
+REQUEST_TIMEOUT=(5, 60) #connect and read seconds, a hung connection would stall the ordered stream of windows
+TABLE_EXTRACTOR='fast' #'fast', 'lxml' or 'bs4' (the original html.parser path)
+SKIPPED_COLUMNS=('Avg. Price', '%chg.', 'Total turnover in denars')
+INTEGER_COLUMNS=('Volume', 'Turnover in BEST in denars')
 # Register custom adapters for datetime.date and datetime.datetime
 def adapt_datetime(dt):
     return dt.isoformat()  # Convert datetime to ISO format string
@@ -13,9 +30,39 @@ def adapt_date(d):
 sqlite3.register_adapter(datetime.datetime, adapt_datetime)
 sqlite3.register_adapter(datetime.date, adapt_date)
 
+class RateLimiter:
+    """Spaces out requests to the same host so they stay under a requests-per-second cap"""
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0
+        self.lock = threading.Lock()
+        self.next_slot = {} #host -> earliest time the next request may start
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def create_session(pool_size=MAX_WORKERS):
+    # One keep-alive session shared by all workers, pool sized so no worker waits for a socket
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+session = create_session()
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
 def fetch_issuers(): #fetching all the issuers
     url = 'https://www.mse.mk/en/stats/symbolhistory/kmb'
-    page = requests.get(url)
+    rate_limiter.wait(url)
+    page = session.get(url, timeout=REQUEST_TIMEOUT)
     soup = BeautifulSoup(page.text, 'html.parser')
     select_element = soup.find('select', {'id': 'Code'})
     list_of_codes = []
@@ -33,15 +80,28 @@ def filter_valid_issuers(all_issuers):
             filtered_issuers.append(issuer_code)
     return filtered_issuers
 
-def find_date(issuers):
+def load_watermarks():
+    """Read the ingest state of every issuer with one query, {issuer: (last_date, last_attempt, failure_count)}"""
+    conn = sqlite3.connect(DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute('SELECT issuer, last_date, last_attempt, failure_count FROM ingest_state')
+    watermarks = {row[0]: row[1:] for row in cursor.fetchall()}
+    conn.close()
+    return watermarks
+
+def find_date(issuers, skip_fresh=True):
     #return {'KMB': '09/09/2024', 'ALK': '10/10/2024'}
     issuer_and_date={} #empty_dictionary
     #get the current date for calculating "last 10 yrs"
     current_date=datetime.datetime.now()
     ten_years_ago=current_date-datetime.timedelta(days=365*10) 
+    today=current_date.date().isoformat()
+    watermarks=load_watermarks() #last fetched date for every issuer, loaded once
     for issuer in issuers:
-        #check last recorded date in db
-        last_date=get_last_recorded_date(issuer)
+        last_date, last_attempt, failure_count = watermarks.get(issuer, (None, None, 0))
+        #skip issuers that were already fetched completely today
+        if skip_fresh and last_attempt and last_attempt.startswith(today) and not failure_count:
+            continue
         #if no data, use default start date(10yrs ago)
         if not last_date:
             issuer_and_date[issuer]=ten_years_ago.date()
@@ -53,45 +113,129 @@ def find_date(issuers):
 def send_post_request(issuer_code, from_date, to_date):
     url = 'https://www.mse.mk/en/stats/symbolhistory/' + issuer_code
     data = {'FromDate': from_date, 'ToDate': to_date}
-    # Send POST request with FORM data using the data parameter
-    return requests.post(url, data=data)
+    rate_limiter.wait(url)
+    # Send POST request with FORM data using the data parameter, reusing pooled connections
+    return session.post(url, data=data, timeout=REQUEST_TIMEOUT)
 
-# Python code to replace, with . and vice-versa
-def Replace(str1):
-    str1 = str1.replace(',', 'third')
-    str1 = str1.replace('.', ',')
-    str1 = str1.replace('third', '.')
-    return str1
+def to_number(text, integer=False):
+    # cells arrive without thousands separators, empty or malformed cells are stored as NULL
+    if not text:
+        return None
+    try:
+        return int(float(text)) if integer else float(text)
+    except ValueError:
+        return None
 
-def get_data_for_issuer(issuer, from_date, to_date):
-    print("Fetching data for ", issuer, "from ", from_date, " to ", to_date)
-    response = send_post_request(issuer, from_date, to_date)
-    if response.status_code==503:
-        print("Response failed, retrying")
-        response=send_post_request(issuer, from_date, to_date) #retry in case unavailable
-    soup = BeautifulSoup(response.text, 'html.parser')
+def normalize_numbers(values, integer_flags):
+    """Parse the English formatted cells (1,234.56) of a whole table into REAL/INTEGER values"""
+    # per cell, a cell's text can hold a newline of its own (<br>, wrapped markup)
+    return [to_number(text.replace(',', ''), integer) for text, integer in zip(values, integer_flags)]
+
+def extract_table_bs4(page_html):
+    """Return (header_texts, rows_of_cell_texts) of the first table, or None if there is no table"""
+    soup = BeautifulSoup(page_html, 'html.parser')
     table = soup.find('table')  # Find the first table on the page
     if not table:
-        return [] #if service is unavailable, table will be empty
+        return None
     table_rows = table.find_all('tr')
-    header_cells = table_rows[0].find_all('th')
-    header_texts =  [i.text.strip() for i in header_cells]
+    header_texts = [bs4_cell_text(i) for i in own_cells(table_rows[0], 'th')]
+    return header_texts, [[bs4_cell_text(i) for i in own_cells(tr, 'td')] for tr in table_rows[1:]]
+
+def own_cells(tr, tag):
+    # html.parser doesn't close implied end tags, so an unclosed <tr> or <td> holds the ones after it
+    return [cell for cell in tr.find_all(tag) if cell.find_parent('tr') is tr]
+
+def bs4_cell_text(cell):
+    """Text of the cell without the text of cells html.parser nested inside it"""
+    return ''.join(text for text in cell.find_all(string=True) if text.find_parent(['td', 'th']) is cell).strip()
+
+TABLE_RE = re.compile(r'<table\b.*?</table\s*>', re.S | re.I)
+# </tr>, </td> and </th> are optional in HTML, a row or cell also ends where the next one starts:
+# the content runs up to the next tag that opens or closes a row (or, for cells, a cell)
+ROW_RE = re.compile(r'<tr\b[^>]*>([^<]*(?:<(?!/?tr\b)[^<]*)*)', re.I)
+CELL_RE = re.compile(r'<(t[hd])\b[^>]*>([^<]*(?:<(?!/?t[hdr]\b)[^<]*)*)', re.I)
+TAG_RE = re.compile(r'<[^>]*>')
+
+def cell_text(cell_html):
+    if '<' in cell_html:
+        cell_html = TAG_RE.sub('', cell_html)
+    if '&' in cell_html:
+        cell_html = html.unescape(cell_html)
+    return cell_html.strip()
+
+def extract_table_fast(page_html):
+    """Targeted extractor for the MSE history page, only looks at the first table's cells"""
+    match = TABLE_RE.search(page_html)
+    if not match:
+        return None
+    table_rows = [CELL_RE.findall(tr) for tr in ROW_RE.findall(match.group(0))]
+    if not table_rows:
+        return None
+    header_texts = [cell_text(text) for tag, text in table_rows[0] if tag.lower() == 'th']
+    rows = [[cell_text(text) for tag, text in tr if tag.lower() == 'td'] for tr in table_rows[1:]]
+    return header_texts, rows
+
+def extract_table_lxml(page_html):
+    # iter includes the root, which is the table itself when the page is just a table
+    table = next(lxml.html.fromstring(page_html).iter('table'), None)
+    if table is None:
+        return None
+    table_rows = list(table.iter('tr'))
+    if not table_rows:
+        return None
+    header_texts = [i.text_content().strip() for i in table_rows[0].iter('th')]
+    return header_texts, [[i.text_content().strip() for i in tr.iter('td')] for tr in table_rows[1:]]
+
+TABLE_EXTRACTORS = {'bs4': extract_table_bs4, 'fast': extract_table_fast}
+try:
+    import lxml.html
+    TABLE_EXTRACTORS['lxml'] = extract_table_lxml
+except ImportError:
+    pass #lxml is optional, the fast extractor does not need it
+
+def parse_history_page(page_html, issuer, extractor=TABLE_EXTRACTOR):
+    """Turn a symbol history page into transactions rows, the same for every extractor"""
+    table = TABLE_EXTRACTORS.get(extractor, extract_table_fast)(page_html)
+    if not table:
+        return [] #if service is unavailable, table will be empty
+    header_texts, cell_rows = table
+    # rows that don't have a cell per header (empty spacer rows, broken markup) can't be written
+    cell_rows = [cells for cells in cell_rows if len(cells) == len(header_texts)]
+    #only fetching the columns we want
+    wanted = [index for index, header in enumerate(header_texts) if header not in SKIPPED_COLUMNS]
+    date_index = header_texts.index('Date') if 'Date' in header_texts else None
+    # normalize every number of the table in one pass, then hand them out row by row
+    number_columns = [index for index in wanted if index != date_index]
+    numbers = iter(normalize_numbers([cells[index] for cells in cell_rows for index in number_columns],
+                                     [header_texts[index] in INTEGER_COLUMNS for index in number_columns] * len(cell_rows)))
     data = []
-    for tr in table_rows[1:]:
-        td = tr.find_all('td')
-        row=[issuer]
-        for header, i in zip(header_texts, td):
-            if header=='Avg. Price' or header=='%chg.'  or header=='Total turnover in denars':
-                continue #only fetching the columns we want
-            if header=='Date':
-                date_obj=datetime.datetime.strptime(i.text.strip(),'%m/%d/%Y').date()
-                row.append(date_obj)
+    for cells in cell_rows:
+        row = [issuer]
+        for index in wanted:
+            if index == date_index:
+                row.append(datetime.datetime.strptime(cells[index], '%m/%d/%Y').date())
             else:
-                row.append(Replace(i.text.strip()))
-        # row = [i.text.strip() for i in td] 
+                row.append(next(numbers))
         data.append(row)
     return data
 
+def get_data_for_issuer(issuer, from_date, to_date, extractor=TABLE_EXTRACTOR):
+    print("Fetching data for ", issuer, "from ", from_date, " to ", to_date)
+    response = send_post_request(issuer, from_date, to_date)
+    if response.status_code==503:
+        print("Response failed, retrying")
+        response=send_post_request(issuer, from_date, to_date) #retry in case unavailable
+    response.raise_for_status()
+    return parse_history_page(response.text, issuer, extractor)
+
+def fetch_window(issuer, from_date, to_date):
+    # a failed window is reported instead of raised, so one issuer can't stop the whole run
+    try:
+        return get_data_for_issuer(issuer, from_date, to_date), False
+    except requests.RequestException as e:
+        print("Fetching failed for ", issuer, "from ", from_date, " to ", to_date, e)
+        return [], True
+
 def add_year(date_obj):
     date_obj+=datetime.timedelta(days=365)
     return date_obj
@@ -112,29 +256,155 @@ def split_date_range(from_date):
     date_ranges.append((from_date, today))
     return date_ranges
 
-def get_latest_data(issuers_and_dates):
+def stream_latest_data(issuers_and_dates, max_workers=MAX_WORKERS):
+    """Yield (issuer, rows, issuer_done, failed) for every one year window as soon as it is parsed.
+    Windows come out in date order per issuer, so a commit never leaves a gap behind
+    the watermark that find_date resumes from."""
+    tasks = [(issuer, start_date, end_date)
+             for issuer, from_date in issuers_and_dates.items()
+             for start_date, end_date in split_date_range(from_date)]
+    def issuer_done(index):
+        return index + 1 == len(tasks) or tasks[index + 1][0] != tasks[index][0]
+    if max_workers <= 1:
+        for index, task in enumerate(tasks):
+            rows, failed = fetch_window(*task)
+            yield task[0], rows, issuer_done(index), failed
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # keep a bounded number of requests in flight ahead of the consumer
+        pending = deque()
+        for index, task in enumerate(tasks):
+            pending.append((index, executor.submit(fetch_window, *task)))
+            if len(pending) >= max_workers * 2:
+                done_index, future = pending.popleft()
+                rows, failed = future.result()
+                yield tasks[done_index][0], rows, issuer_done(done_index), failed
+        while pending:
+            done_index, future = pending.popleft()
+            rows, failed = future.result()
+            yield tasks[done_index][0], rows, issuer_done(done_index), failed
+
+def get_latest_data(issuers_and_dates, max_workers=MAX_WORKERS):
     latest_data = []
-    for issuer, from_date in issuers_and_dates.items():
-        for start_date, end_date in split_date_range(from_date):
-            latest_data+=get_data_for_issuer(issuer, start_date, end_date)
+    for _, rows, _, _ in stream_latest_data(issuers_and_dates, max_workers):
+        latest_data+=rows
     return latest_data
 
+def write_stream(windows, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+    """Write the windows of stream_latest_data on a writer thread while fetching continues.
+    Commits every batch_size rows and whenever an issuer is complete, the ingest_state
+    watermark is updated in the same transaction as the rows. Returns rows written."""
+    create_table()
+    windows_queue = queue.Queue(maxsize=queue_size)
+    result = {'rows': 0, 'error': None}
+
+    def writer():
+        conn = sqlite3.connect(DB_NAME)
+        cursor = conn.cursor()
+        uncommitted = 0
+        failed_issuers = set() #windows after a failed one must not move the watermark past the gap
+        while True:
+            item = windows_queue.get()
+            if item is None:
+                break
+            if result['error']:
+                continue #keep draining so the producer never blocks on a full queue
+            issuer, rows, issuer_done, failed = item
+            try:
+                if failed:
+                    failed_issuers.add(issuer)
+                if rows:
+                    cursor.executemany('INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                    bump_data_version(cursor, issuer)
+                    uncommitted+=len(rows)
+                    if issuer not in failed_issuers:
+                        advance_watermark(cursor, issuer, max(row[1] for row in rows))
+                if issuer_done:
+                    finish_issuer(cursor, issuer, issuer in failed_issuers)
+                    failed_issuers.discard(issuer)
+                if uncommitted >= batch_size or issuer_done:
+                    conn.commit()
+                    result['rows']+=uncommitted
+                    uncommitted = 0
+            except sqlite3.Error as e:
+                print("Writing failed for ", issuer, e)
+                result['error'] = e
+        if not result['error']:
+            conn.commit()
+            result['rows']+=uncommitted
+        conn.close()
+
+    writer_thread = threading.Thread(target=writer, name='db-writer')
+    writer_thread.start()
+    try:
+        for window in windows:
+            if result['error']:
+                break
+            windows_queue.put(window)
+    finally:
+        windows_queue.put(None)
+        writer_thread.join()
+    if result['error']:
+        raise result['error']
+    return result['rows']
+
+def advance_watermark(cursor, issuer, last_date):
+    cursor.execute('''
+    INSERT INTO ingest_state (issuer, last_date, failure_count) VALUES (?, ?, 0)
+    ON CONFLICT(issuer) DO UPDATE SET last_date = MAX(COALESCE(last_date, excluded.last_date), excluded.last_date)
+    ''', (issuer, last_date))
+
+def bump_data_version(cursor, issuer):
+    # the API caches responses per issuer and drops them as soon as this number changes
+    cursor.execute('''
+    INSERT INTO ingest_state (issuer, data_version) VALUES (?, 1)
+    ON CONFLICT(issuer) DO UPDATE SET data_version = data_version + 1
+    ''', (issuer,))
+
+def finish_issuer(cursor, issuer, failed):
+    # a complete run resets the failure count, a run with a failed window adds one
+    cursor.execute('''
+    INSERT INTO ingest_state (issuer, last_attempt, failure_count) VALUES (?, ?, ?)
+    ON CONFLICT(issuer) DO UPDATE SET last_attempt = excluded.last_attempt,
+        failure_count = CASE WHEN excluded.failure_count > 0 THEN failure_count + 1 ELSE 0 END
+    ''', (issuer, datetime.datetime.now(), int(failed)))
+
 def create_table():
     # This function ensures that the table is created before any data is written
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
+    # WAL so the API's read-only connections keep reading while the scraper writes
+    cursor.execute('PRAGMA journal_mode=WAL')
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS transactions(
         issuer TEXT,
         date DATE, 
-        last_trade_price FLOAT,
-        max FLOAT,
-        min FLOAT,
+        last_trade_price REAL,
+        max REAL,
+        min REAL,
         volume INTEGER,
         turnover_best INTEGER,
         PRIMARY KEY (issuer, date)
     )
     ''')
+    # one row per issuer: the last date we have, when it was last fetched and how often that failed
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingest_state(
+        issuer TEXT PRIMARY KEY,
+        last_date DATE,
+        last_attempt TIMESTAMP,
+        failure_count INTEGER DEFAULT 0,
+        data_version INTEGER DEFAULT 0
+    )
+    ''')
+    if 'data_version' not in [column[1] for column in cursor.execute('PRAGMA table_info(ingest_state)')]:
+        cursor.execute('ALTER TABLE ingest_state ADD COLUMN data_version INTEGER DEFAULT 0')
+    if cursor.execute('SELECT COUNT(*) FROM ingest_state').fetchone()[0] == 0:
+        # databases filled before ingest_state existed are seeded from the data once
+        cursor.execute('''
+        INSERT INTO ingest_state (issuer, last_date)
+        SELECT issuer, MAX(date) FROM transactions GROUP BY issuer
+        ''')
     conn.commit()
     conn.close()
 
@@ -144,6 +414,12 @@ def write_to_db(data):
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
     cursor.executemany('INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)', data)
+    last_dates = {}
+    for row in data:
+        last_dates[row[0]] = max(last_dates.get(row[0], row[1]), row[1])
+    for issuer, last_date in last_dates.items():
+        advance_watermark(cursor, issuer, last_date)
+        bump_data_version(cursor, issuer)
     conn.commit()
     conn.close()
 
@@ -183,16 +459,10 @@ if __name__ == '__main__':
     for key, value in issuers_and_dates.items():
         print(key, value)
 
-    # Filter 3: Get data for each issuer from the specified date
-    entries = get_latest_data(issuers_and_dates)
-    print("Number of entries fetched ", len(entries))
-
-    before_writing=datetime.datetime.now()
-    # Write data to the database
-    write_to_db(entries)
-    after_writing=datetime.datetime.now()
-    running_time=after_writing-before_writing
-    print("Writing time to DB took: ", running_time.seconds, "seconds")
+    # Filter 3: Get data for each issuer from the specified date and
+    # Filter 4: Write it to the database while the next windows are being fetched
+    entries = write_stream(stream_latest_data(issuers_and_dates))
+    print("Number of entries written ", entries)
     end_of_execution=datetime.datetime.now()
     execution_time=end_of_execution-before_execution
     print("Execution time took: ", execution_time.seconds, "seconds")
@@ -0,0 +1,335 @@
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Windows used by technical_analysis, the same defaults the ta classes were called with
+DEFAULT_WINDOWS = {
+    'RSI': 2,
+    'STOCH': 14,
+    'MACD_FAST': 12,
+    'MACD_SLOW': 26,
+    'MACD_SIGN': 9,
+    'SMA': 2,
+    'EMA': 2,
+    'WilliamsR': 14,
+    'ROC': 12,
+    'ADX': 14,
+    'BB': 20,
+    'BB_DEV': 2,
+    'ATR': 14,
+    'CCI': 20,
+}
+CCI_CONSTANT = 0.015
+
+def _ewm(values, alpha=None, span=None, min_periods=0):
+    # pandas' adjust=False ewm is the recursive y[i] = (1 - a) * y[i-1] + a * x[i] done in C
+    return pd.Series(values).ewm(alpha=alpha, span=span, min_periods=min_periods, adjust=False).mean().to_numpy()
+
+def _rolling(values, window, function):
+    """Rolling reduction over contiguous windows, NaN until the window is full (min_periods=window)"""
+    output = np.full(len(values), np.nan)
+    if window <= len(values):
+        output[window - 1:] = function(sliding_window_view(values, window), axis=-1)
+    return output
+
+def _shift(values, periods=1):
+    output = np.full(len(values), np.nan)
+    output[periods:] = values[:-periods]
+    return output
+
+def _wilder_from(seed, values, window):
+    """y[0] = seed, y[i] = (y[i-1] * (window - 1) + values[i]) / window"""
+    return _ewm(np.concatenate(([seed], values)), alpha=1 / window)
+
+def _continue(seed, values, alpha=None, span=None):
+    """Carry an adjust=False EWM on from the last value of a previous run"""
+    return _ewm(np.concatenate(([seed], values)), alpha=alpha, span=span)[1:]
+
+class IndicatorEngine:
+    """Computes the whole indicator set over one issuer's high/low/close arrays.
+    Pieces several indicators need (price differences, rolling min/max and means,
+    EMAs by span, the true range) are computed once and shared. Results match the
+    ta library classes technical_analysis used before, to floating point precision.
+
+    Given a state from state_at of an earlier run, the arrays only hold the bars after
+    that state: rolling windows are filled from the stored input tail and the EMA style
+    recursions carry on from their stored values, so only the new bars are computed."""
+
+    def __init__(self, high, low, close, windows=None, state=None):
+        self.windows = {**DEFAULT_WINDOWS, **(windows or {})}
+        self.state = state
+        tail = state['tail'] if state else {'high': [], 'low': [], 'close': []}
+        self.offset = len(tail['close']) #bars of the stored tail in front of the new ones
+        self.high = np.ascontiguousarray(np.concatenate((tail['high'], high)), dtype='float64')
+        self.low = np.ascontiguousarray(np.concatenate((tail['low'], low)), dtype='float64')
+        self.close = np.ascontiguousarray(np.concatenate((tail['close'], close)), dtype='float64')
+        self._cache = {}
+        self._series = {} #recursive series over the new bars, the state is read from them
+
+    def _shared(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _new(self, values):
+        return values[self.offset:]
+
+    def tail_size(self):
+        """Input bars a rolling window or shift looks back on"""
+        w = self.windows
+        return max(w['STOCH'], w['WilliamsR'], w['SMA'], w['BB'], w['CCI'], w['ROC'], 2)
+
+    def warmup(self):
+        """Bars after which every recursion has left its NaN/zero warm-up, earlier states are not stored"""
+        w = self.windows
+        return max(2 * w['ADX'], w['MACD_SLOW'] + w['MACD_SIGN'], w['RSI'], w['ATR'], w['EMA'], w['MACD_FAST']) + 1
+
+    # shared intermediates
+    def close_diff(self):
+        return self._shared('close_diff', lambda: np.diff(self.close, prepend=np.nan))
+
+    def ema(self, span):
+        def compute():
+            close = self._new(self.close)
+            if self.state:
+                return _continue(self.state['ema'][str(span)], close, span=span)
+            return _ewm(close, span=span, min_periods=span)
+        self._series[('ema', span)] = self._shared(('ema', span), compute)
+        return self._series[('ema', span)]
+
+    def rolling_mean(self, window):
+        return self._shared(('mean', window), lambda: _rolling(self.close, window, np.mean))
+
+    def lowest_low(self, window):
+        return self._shared(('low', window), lambda: _rolling(self.low, window, np.min))
+
+    def highest_high(self, window):
+        return self._shared(('high', window), lambda: _rolling(self.high, window, np.max))
+
+    def true_range(self):
+        def compute():
+            previous_close = _shift(self.close)
+            ranges = np.vstack([self.high - self.low, np.abs(self.high - previous_close), np.abs(self.low - previous_close)])
+            return np.nanmax(ranges, axis=0)
+        return self._shared('true_range', compute)
+
+    # indicators
+    def rsi(self):
+        window = self.windows['RSI']
+        diff = self._new(self.close_diff())
+        up = np.where(diff > 0, diff, 0.0)
+        down = np.where(diff < 0, -diff, 0.0)
+        if self.state:
+            ema_up = _continue(self.state['rsi_up'], up, alpha=1 / window)
+            ema_down = _continue(self.state['rsi_down'], down, alpha=1 / window)
+        else:
+            ema_up = _ewm(up, alpha=1 / window, min_periods=window)
+            ema_down = _ewm(down, alpha=1 / window, min_periods=window)
+        self._series['rsi_up'], self._series['rsi_down'] = ema_up, ema_down
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(ema_down == 0, 100, 100 - (100 / (1 + ema_up / ema_down)))
+
+    def stoch(self):
+        window = self.windows['STOCH']
+        lowest, highest = self.lowest_low(window), self.highest_high(window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._new(100 * (self.close - lowest) / (highest - lowest))
+
+    def williams_r(self):
+        window = self.windows['WilliamsR']
+        lowest, highest = self.lowest_low(window), self.highest_high(window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._new(-100 * (highest - self.close) / (highest - lowest))
+
+    def macd(self):
+        macd = self.ema(self.windows['MACD_FAST']) - self.ema(self.windows['MACD_SLOW'])
+        sign = self.windows['MACD_SIGN']
+        if self.state:
+            signal_line = _continue(self.state['macd_signal'], macd, span=sign)
+        else:
+            signal_line = _ewm(macd, span=sign, min_periods=sign)
+        self._series['macd_signal'] = signal_line
+        return macd, signal_line
+
+    def sma(self):
+        return self._new(self.rolling_mean(self.windows['SMA']))
+
+    def roc(self):
+        previous = _shift(self.close, self.windows['ROC'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._new((self.close - previous) / previous * 100)
+
+    def bollinger(self):
+        window = self.windows['BB']
+        mean = self.rolling_mean(window)
+        std = _rolling(self.close, window, np.std) #ddof=0 like ta
+        deviation = self.windows['BB_DEV'] * std
+        return self._new(mean + deviation), self._new(mean), self._new(mean - deviation)
+
+    def atr(self):
+        window = self.windows['ATR']
+        true_range = self._new(self.true_range())
+        if self.state:
+            atr = _continue(self.state['atr'], true_range, alpha=1 / window)
+        else:
+            atr = np.zeros(len(true_range))
+            if len(true_range) >= window:
+                atr[window - 1:] = _wilder_from(true_range[:window].mean(), true_range[window:], window)
+        self._series['atr'] = atr
+        return atr
+
+    def cci(self):
+        window = self.windows['CCI']
+        typical = (self.high + self.low + self.close) / 3.0
+        mean = _rolling(typical, window, np.mean)
+        mad = np.full(len(typical), np.nan)
+        if window <= len(typical):
+            windows = sliding_window_view(typical, window)
+            mad[window - 1:] = np.abs(windows - windows.mean(axis=1, keepdims=True)).mean(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._new((typical - mean) / (CCI_CONSTANT * mad))
+
+    def adx(self):
+        # follows ta's ADXIndicator step by step, including its zero warm-up
+        window = self.windows['ADX']
+        directional_movement = self.true_range().copy()
+        directional_movement[0] = np.nan #ta takes max/min against the previous close, NaN on the first bar
+        diff_up = self.high - _shift(self.high)
+        diff_down = _shift(self.low) - self.low
+        pos = np.where((diff_up > diff_down) & (diff_up > 0), diff_up, 0.0)
+        neg = np.where((diff_down > diff_up) & (diff_down > 0), diff_down, 0.0)
+        pos[0] = neg[0] = np.nan
+        directional_movement, pos, neg = self._new(directional_movement), self._new(pos), self._new(neg)
+        size = len(directional_movement)
+
+        def smoothed(values, key):
+            # ta: s = sum of the first window values, then s = s - s / window + value for every later bar
+            if self.state:
+                return window * _continue(self.state[key] / window, values, alpha=1 / window)
+            output = np.full(size, np.nan)
+            first = values[~np.isnan(values)][:window].sum()
+            output[window:] = window * _wilder_from(first / window, values[window + 1:], window)
+            return output
+
+        # ta's ADXIndicator raises below 2 * window bars, the column is left NaN there instead
+        if not self.state and size < 2 * window:
+            return np.full(size, np.nan)
+        trs, dip, din = smoothed(directional_movement, 'adx_trs'), smoothed(pos, 'adx_dip'), smoothed(neg, 'adx_din')
+        self._series['adx_trs'], self._series['adx_dip'], self._series['adx_din'] = trs, dip, din
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dip = np.where(trs != 0, 100 * dip / trs, 0)
+            din = np.where(trs != 0, 100 * din / trs, 0)
+            dx = np.where(dip + din != 0, 100 * np.abs((dip - din) / (dip + din)), 0)
+        if self.state:
+            adx = _continue(self.state['adx'], dx, alpha=1 / window)
+        else:
+            adx = np.zeros(size)
+            adx[2 * window - 1:] = _wilder_from(dx[window:2 * window].mean(), dx[2 * window:], window)
+        self._series['adx'] = adx
+        return adx
+
+    def compute_all(self):
+        """Every indicator as {column name: array}, in one pass over the shared pieces"""
+        macd, signal_line = self.macd()
+        bb_high, bb_mid, bb_low = self.bollinger()
+        return {
+            'RSI': self.rsi(),
+            'STOCH': self.stoch(),
+            'MACD': macd,
+            'Signal_Line': signal_line,
+            'SMA': self.sma(),
+            'EMA': self.ema(self.windows['EMA']),
+            'WilliamsR': self.williams_r(),
+            'ROC': self.roc(),
+            'ADX': self.adx(),
+            'BB_High': bb_high,
+            'BB_Mid': bb_mid,
+            'BB_Low': bb_low,
+            'ATR': self.atr(),
+            'CCI': self.cci(),
+        }
+
+    def state_at(self, index):
+        """State after the new bar at index, for a later run to continue from.
+        Call after compute_all. Returns the state this run started from when index < 0,
+        and None while the history is still too short to continue exactly."""
+        if index < 0:
+            return self.state
+        bars = (self.state['bars'] if self.state else 0) + index + 1
+        if bars < self.warmup():
+            return None
+        position = self.offset + index
+        start = max(0, position + 1 - self.tail_size())
+        spans = {self.windows['EMA'], self.windows['MACD_FAST'], self.windows['MACD_SLOW']}
+        return {
+            'bars': bars,
+            'tail': {name: values[start:position + 1].tolist()
+                     for name, values in (('high', self.high), ('low', self.low), ('close', self.close))},
+            'ema': {str(span): float(self._series[('ema', span)][index]) for span in spans},
+            **{key: float(self._series[key][index])
+               for key in ('rsi_up', 'rsi_down', 'macd_signal', 'atr', 'adx_trs', 'adx_dip', 'adx_din', 'adx')},
+        }
+
+def calculate_all(df, windows=None):
+    """Indicator columns for a frame with last_trade_price/max/min columns, same index as df"""
+    engine = IndicatorEngine(df['max'].to_numpy(), df['min'].to_numpy(), df['last_trade_price'].to_numpy(), windows)
+    return pd.DataFrame(engine.compute_all(), index=df.index)
+
+def calculate_with_ta(df, windows=None):
+    """The per-indicator ta path the engine replaces, kept for comparison and benchmarking.
+    ADX and ATR raise in ta on histories shorter than they need, those get the engine's columns for it."""
+    from ta.momentum import RSIIndicator, StochasticOscillator, WilliamsRIndicator, ROCIndicator
+    from ta.trend import MACD, SMAIndicator, EMAIndicator, ADXIndicator, CCIIndicator
+    from ta.volatility import BollingerBands, AverageTrueRange
+    w = {**DEFAULT_WINDOWS, **(windows or {})}
+    high, low, close = df['max'], df['min'], df['last_trade_price']
+    macd = MACD(close=close, window_slow=w['MACD_SLOW'], window_fast=w['MACD_FAST'], window_sign=w['MACD_SIGN'])
+    bands = BollingerBands(close=close, window=w['BB'], window_dev=w['BB_DEV'])
+    return pd.DataFrame({
+        'RSI': RSIIndicator(close=close, window=w['RSI']).rsi(),
+        'STOCH': StochasticOscillator(high=high, low=low, close=close, window=w['STOCH']).stoch(),
+        'MACD': macd.macd(),
+        'Signal_Line': macd.macd_signal(),
+        'SMA': SMAIndicator(close=close, window=w['SMA']).sma_indicator(),
+        'EMA': EMAIndicator(close=close, window=w['EMA']).ema_indicator(),
+        'WilliamsR': WilliamsRIndicator(high=high, low=low, close=close, lbp=w['WilliamsR']).williams_r(),
+        'ROC': ROCIndicator(close=close, window=w['ROC']).roc(),
+        'ADX': ADXIndicator(high=high, low=low, close=close, window=w['ADX']).adx()
+               if len(df) >= 2 * w['ADX'] else pd.Series(np.nan, index=df.index), #raises on fewer bars
+        'BB_High': bands.bollinger_hband(),
+        'BB_Mid': bands.bollinger_mavg(),
+        'BB_Low': bands.bollinger_lband(),
+        'ATR': AverageTrueRange(high=high, low=low, close=close, window=w['ATR']).average_true_range()
+               if len(df) >= w['ATR'] else pd.Series(0.0, index=df.index), #raises on fewer, all warm-up zeros
+        'CCI': CCIIndicator(high=high, low=low, close=close, window=w['CCI'], constant=CCI_CONSTANT).cci(),
+    }, index=df.index)
+
+def synthetic_prices(rows, seed=0):
+    """Random walk with the columns load_data returns, for benchmarks"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+    spread = np.abs(rng.normal(0, 0.005, rows)) * close
+    return pd.DataFrame({
+        'last_trade_price': close,
+        'max': close + spread,
+        'min': close - spread,
+        'volume': rng.integers(1, 10000, rows).astype(float),
+    }, index=pd.date_range('2014-01-01', periods=rows, freq='D'))
+
+def benchmark(rows=2500, repeat=5):
+    """Time the engine against the ta path on the same frame, returns seconds per run for both"""
+    df = synthetic_prices(rows)
+    timings = {}
+    for name, function in (('engine', calculate_all), ('ta', calculate_with_ta)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            function(df)
+        timings[name] = (time.perf_counter() - started) / repeat
+    return timings
+
+if __name__ == '__main__':
+    for rows in (250, 2500, 10000):
+        timings = benchmark(rows)
+        print(f"{rows} rows: engine {timings['engine'] * 1000:.2f} ms, ta {timings['ta'] * 1000:.2f} ms, "
+              f"speedup {timings['ta'] / timings['engine']:.1f}x")
@@ -1,43 +1,84 @@
+import argparse
+import json
+import os
 import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-from ta.momentum import RSIIndicator, StochasticOscillator
-from ta.trend import MACD, CCIIndicator, SMAIndicator, EMAIndicator
 import numpy as np
 import logging
-from ta.momentum import WilliamsRIndicator, ROCIndicator
-from ta.trend import ADXIndicator
-from ta.volatility import BollingerBands, AverageTrueRange
+from indicator_engine import IndicatorEngine
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_data(issuer):
-    """Load data from SQLite database"""
+# Process different time periods
+TIME_PERIODS = {
+    '1 Day': 'D',  # Daily
+    '1 Week': 'W',  # Weekly
+    '1 Month': 'ME'  # Monthly
+}
+
+def parse_legacy_number(value):
+    """Rewrite the old Macedonian formatted text (1.234,56) as 1234.56, numbers pass through"""
+    if isinstance(value, str):
+        return value.replace('.', '').replace(',', '.')
+    return value
+
+# Columnar copy of transactions built by Homework 4's models/timeseries_store.py, optional
+STOCK_DATA_STORE = os.environ.get('STOCK_DATA_STORE')
+
+def load_data_from_store(conn, issuer, since=None):
+    """Load the issuer's memory-mapped arrays from STOCK_DATA_STORE,
+    None if the store doesn't have the issuer at the version in the database"""
+    manifest_path = os.path.join(STOCK_DATA_STORE, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        entry = json.load(f)['issuers'].get(issuer)
+    try:
+        version = conn.execute('SELECT data_version FROM ingest_state WHERE issuer = ?', (issuer,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if entry is None or not version or not version[0] or entry['data_version'] != version[0]:
+        return None
+    directory = os.path.join(STOCK_DATA_STORE, entry['path'])
+    dates = np.load(os.path.join(directory, 'date.npy'), mmap_mode='r')
+    start = np.searchsorted(dates, np.datetime64(since.date(), 'D'), side='right') if since else 0
+    df = pd.DataFrame(
+        {column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r')[start:]
+         for column in ['last_trade_price', 'max', 'min', 'volume']},
+        index=pd.DatetimeIndex(dates[start:].astype('datetime64[ns]'), name='date'),
+    )
+    return df.dropna()
+
+def load_data(issuer, since=None):
+    """Load data from SQLite database, only the days after since if it is given"""
     try:
         conn = sqlite3.connect('updated_stocks_database.db')
+        if STOCK_DATA_STORE:
+            df = load_data_from_store(conn, issuer, since)
+            if df is not None:
+                conn.close()
+                return df
         query = f"""
         SELECT date, last_trade_price, max, min, volume 
         FROM transactions 
-        WHERE issuer = '{issuer}'
+        WHERE issuer = ?{' AND date > ?' if since else ''}
         ORDER BY date
         """
-        df = pd.read_sql_query(query, conn)
+        params = (issuer, since.date().isoformat()) if since else (issuer,)
+        df = pd.read_sql_query(query, conn, params=params)
         print(df)
         df['date'] = pd.to_datetime(df['date'])
         df.set_index('date', inplace=True)
 
-        #conversion 
-        df['last_trade_price'] = df['last_trade_price'].str.replace(',', '', regex=False)
-        df['max'] = df['max'].str.replace(',', '', regex=False)
-        df['min'] = df['min'].str.replace(',', '', regex=False)
-        df['volume'] = df['volume'].str.replace(',', '', regex=False)
-        
-        # Convert columns to numeric
-        df['last_trade_price'] = pd.to_numeric(df['last_trade_price'], errors='coerce')
-        df['max'] = pd.to_numeric(df['max'], errors='coerce')
-        df['min'] = pd.to_numeric(df['min'], errors='coerce')
-        df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
+        # New databases store numbers, only rows written before the numeric migration need parsing
+        for column in ['last_trade_price', 'max', 'min', 'volume']:
+            if not pd.api.types.is_numeric_dtype(df[column]):
+                df[column] = df[column].map(parse_legacy_number)
+            df[column] = pd.to_numeric(df[column], errors='coerce')
         # Remove any rows with NaN values
         print("After conversion", df)
         df = df.dropna()
@@ -49,28 +90,15 @@ def load_data(issuer):
         return pd.DataFrame()
 
 
-def calculate_indicators_and_generate_signals(df):
-    """Calculate technical indicators and generate trading signals"""
+def calculate_indicators_and_generate_signals(df, engine=None):
+    """Calculate technical indicators and generate trading signals.
+    An engine built from a stored state computes only the bars in df that came after it."""
     try:
-        # RSI
-        df['RSI'] = RSIIndicator(close=df['last_trade_price'], window=2).rsi()
-        
-        # Stochastic
-        df['STOCH'] = StochasticOscillator(
-            high=df['max'],
-            low=df['min'],
-            close=df['last_trade_price'],
-            window=14
-        ).stoch()
-        
-        # MACD
-        macd = MACD(close=df['last_trade_price'])
-        df['MACD'] = macd.macd()
-        df['Signal_Line'] = macd.macd_signal()
-        
-        # Moving Averages
-        df['SMA'] = SMAIndicator(close=df['last_trade_price'], window=2).sma_indicator()
-        df['EMA'] = EMAIndicator(close=df['last_trade_price'], window=2).ema_indicator()
+        # RSI, Stochastic, MACD, moving averages, Williams %R, ROC, ADX, Bollinger Bands, ATR and CCI
+        # in one pass over the price arrays, sharing the rolling windows and EMAs between them
+        engine = engine or IndicatorEngine(df['max'], df['min'], df['last_trade_price'])
+        for column, values in engine.compute_all().items():
+            df[column] = values
         
         # Generate signals
         df['RSI_Signal'] = 'Hold'
@@ -104,21 +132,84 @@ def resample_data(df, freq):
         logger.error(f"Error resampling data: {e}")
         return pd.DataFrame()
 
-def save_results(df, issuer, freq):
-    """Save analysis results to database"""
+# Rows per executemany/transaction when upserting analysis_results
+UPSERT_BATCH_SIZE = 5000
+RESULT_KEY = ('date', 'issuer', 'time_period')
+
+def upsert_sql(columns, source=None):
+    """INSERT ... ON CONFLICT for analysis_results that leaves rows whose values did not change untouched"""
+    values = [column for column in columns if column not in RESULT_KEY]
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    if source is None:
+        select = f"VALUES ({', '.join('?' * len(columns))})"
+    else:
+        select = f"SELECT {column_list} FROM {source} WHERE true" #WHERE keeps ON CONFLICT from parsing as a join
+    return f"""
+    INSERT INTO analysis_results ({column_list}) {select}
+    ON CONFLICT ({', '.join(RESULT_KEY)}) DO UPDATE SET
+    {', '.join(f'"{column}" = excluded."{column}"' for column in values)}
+    WHERE {' OR '.join(f'analysis_results."{column}" IS NOT excluded."{column}"' for column in values)}
+    """
+
+def upsert_results(conn, df, batch_size=UPSERT_BATCH_SIZE, staging=False):
+    """Bulk upsert df (date, issuer and time_period columns included) into analysis_results,
+    one transaction per batch. With staging the batch is loaded into a temp table first and
+    merged with a single INSERT ... SELECT. Returns the number of rows inserted or changed."""
+    columns = list(df.columns)
+    records = df.astype(object).where(df.notna(), None)
+    records['date'] = records['date'].astype(str)
+    rows = list(records.itertuples(index=False, name=None))
+    placeholders = ', '.join('?' * len(columns))
+    if staging:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS analysis_staging AS SELECT * FROM analysis_results WHERE 0')
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        stage = f"INSERT INTO analysis_staging ({column_list}) VALUES ({placeholders})"
+        merge = upsert_sql(columns, source='analysis_staging')
+    else:
+        insert = upsert_sql(columns)
+    changed = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        with conn:
+            if staging:
+                conn.executemany(stage, batch)
+                changed += conn.execute(merge).rowcount
+                conn.execute('DELETE FROM analysis_staging')
+            else:
+                changed += conn.executemany(insert, batch).rowcount
+    return changed
+
+def save_results(df, issuer, freq, state=None, state_date=None, staging=False):
+    """Upsert analysis results into the database, rows that did not change are not rewritten.
+    The indicator state the next incremental run continues from is saved once the rows are in."""
     try:
         conn = sqlite3.connect('updated_stocks_database.db')
         df.reset_index(inplace=True)
         df['issuer'] = issuer
         df['time_period'] = freq
         
-        # Use INSERT OR REPLACE to avoid unique constraint violations
-        df.to_sql('analysis_results', conn, if_exists='replace', index=False)
+        changed = upsert_results(conn, df, staging=staging)
+        with conn:
+            if state is None:
+                conn.execute('DELETE FROM indicator_state WHERE issuer = ? AND time_period = ?', (issuer, freq))
+            else:
+                conn.execute('INSERT OR REPLACE INTO indicator_state VALUES (?, ?, ?, ?)',
+                             (issuer, freq, str(state_date), json.dumps(state)))
         conn.close()
-        logger.info(f"Successfully saved results for {issuer} - {freq}")
+        logger.info(f"Successfully saved results for {issuer} - {freq} ({changed} of {len(df)} rows changed)")
     except Exception as e:
         logger.error(f"Error saving results: {e}")
 
+def load_indicator_states():
+    """Stored indicator states of every issuer with one query, {(issuer, time period): (date, state)}"""
+    try:
+        conn = sqlite3.connect('updated_stocks_database.db')
+        rows = conn.execute('SELECT issuer, time_period, last_date, state FROM indicator_state').fetchall()
+        conn.close()
+        return {(issuer, period): (pd.Timestamp(last_date), json.loads(state)) for issuer, period, last_date, state in rows}
+    except Exception as e:
+        logger.error(f"Error loading indicator states: {e}")
+        return {}
 
 def get_issuers():
     """Get list of unique issuers from database"""
@@ -133,30 +224,56 @@ def get_issuers():
         logger.error(f"Error getting issuers: {e}")
         return []
 
+# Every column of analysis_results, new indicator columns are added to existing tables
+ANALYSIS_COLUMNS = [
+    ('date', 'DATE'), ('issuer', 'TEXT'), ('time_period', 'TEXT'),
+    ('last_trade_price', 'FLOAT'), ('max', 'FLOAT'), ('min', 'FLOAT'), ('volume', 'FLOAT'),
+    ('RSI', 'FLOAT'), ('STOCH', 'FLOAT'), ('MACD', 'FLOAT'), ('Signal_Line', 'FLOAT'), ('SMA', 'FLOAT'), ('EMA', 'FLOAT'),
+    ('WilliamsR', 'FLOAT'), ('ROC', 'FLOAT'), ('ADX', 'FLOAT'), ('BB_High', 'FLOAT'), ('BB_Mid', 'FLOAT'),
+    ('BB_Low', 'FLOAT'), ('ATR', 'FLOAT'), ('CCI', 'FLOAT'),
+    ('RSI_Signal', 'TEXT'), ('STOCH_Signal', 'TEXT'), ('MACD_Signal', 'TEXT'),
+]
+
 def create_analysis_table():
-    """Create analysis_results table if it doesn't exist"""
+    """Create analysis_results table if it doesn't exist, or add the columns it is missing"""
     try:
         conn = sqlite3.connect('updated_stocks_database.db')
         cursor = conn.cursor()
-        cursor.execute(''' 
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS analysis_results (
-            date DATE,
+            {', '.join(f'{column} {column_type}' for column, column_type in ANALYSIS_COLUMNS)},
+            PRIMARY KEY (date, issuer, time_period)
+        )
+        """)
+        # Tables made before an indicator was added (or by the old to_sql) lack its column
+        existing = {column[1] for column in cursor.execute('PRAGMA table_info(analysis_results)')}
+        for column, column_type in ANALYSIS_COLUMNS:
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE analysis_results ADD COLUMN "{column}" {column_type}')
+                logger.info(f"Added column {column} to analysis_results")
+        # Tables written by the old to_sql(if_exists='replace') have no primary key, the upsert needs one
+        has_key = any(column[5] for column in cursor.execute('PRAGMA table_info(analysis_results)')) or \
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'analysis_results_key'").fetchone()
+        if not has_key:
+            # appends could leave the same bar more than once, keep the last one written
+            removed = cursor.execute('''
+            DELETE FROM analysis_results WHERE rowid NOT IN (
+                SELECT MAX(rowid) FROM analysis_results GROUP BY date, issuer, time_period
+            )
+            ''').rowcount
+            if removed:
+                logger.info(f"Removed {removed} duplicate rows from analysis_results")
+            cursor.execute('CREATE UNIQUE INDEX analysis_results_key ON analysis_results (date, issuer, time_period)')
+        # The API reads one issuer and time period over a date range
+        cursor.execute('CREATE INDEX IF NOT EXISTS analysis_results_issuer_period ON analysis_results (issuer, time_period, date)')
+        # where every stateful indicator stopped, so the next run only computes newer bars
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS indicator_state (
             issuer TEXT,
             time_period TEXT,
-            last_trade_price FLOAT,
-            max FLOAT,
-            min FLOAT,
-            volume FLOAT,
-            RSI FLOAT,
-            STOCH FLOAT,
-            MACD FLOAT,
-            Signal_Line FLOAT,
-            SMA FLOAT,
-            EMA FLOAT,
-            RSI_Signal TEXT,
-            STOCH_Signal TEXT,
-            MACD_Signal TEXT,
-            PRIMARY KEY (date, issuer, time_period)
+            last_date DATE,
+            state TEXT,
+            PRIMARY KEY (issuer, time_period)
         )
         ''')
         conn.commit()
@@ -165,44 +282,76 @@ def create_analysis_table():
     except Exception as e:
         logger.error(f"Error creating analysis table: {e}")
 
+def analyze_issuer(issuer, states=None):
+    """Load an issuer once and analyze every time period from that frame.
+    With a stored state for every period only the days after the oldest state are loaded
+    and only the bars after each state are computed; the last bar is always recomputed
+    because a week or month may still be in progress, so the new state stops one bar short.
+    Returns (issuer, {period name: (analyzed frame, state, state date)}, seconds), runs inside the worker processes."""
+    started = time.perf_counter()
+    states = states or {}
+    incremental = all(period_name in states for period_name in TIME_PERIODS)
+    df = load_data(issuer, since=min(date for date, _ in states.values()) if incremental else None)
+    results = {}
+    if df.empty:
+        return issuer, results, time.perf_counter() - started
+    for period_name, period_code in TIME_PERIODS.items():
+        # Resample and calculate indicators
+        df_resampled = resample_data(df, period_code)
+        state_date, state = states.get(period_name, (None, None)) if incremental else (None, None)
+        if state is not None:
+            df_resampled = df_resampled[df_resampled.index > state_date]
+        if df_resampled.empty:
+            continue
+        engine = IndicatorEngine(df_resampled['max'], df_resampled['min'], df_resampled['last_trade_price'], state=state)
+        df_analyzed = calculate_indicators_and_generate_signals(df_resampled, engine)
+        new_state = engine.state_at(len(df_analyzed) - 2)
+        if len(df_analyzed) >= 2:
+            state_date = df_analyzed.index[-2]
+        results[period_name] = (df_analyzed, new_state, state_date)
+    return issuer, results, time.perf_counter() - started
+
+def run_batch(issuers, workers=None, save=True, incremental=True, staging=False):
+    """Fan the issuers out over a process pool, the results are saved here so there is a single writer"""
+    started = time.perf_counter()
+    done = 0
+    stored_states = load_indicator_states() if incremental else {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(analyze_issuer, issuer,
+                                   {period: stored_states[(issuer, period)] for period in TIME_PERIODS
+                                    if (issuer, period) in stored_states})
+                   for issuer in issuers]
+        for future in as_completed(futures):
+            issuer, results, seconds = future.result()
+            done += 1
+            if not results:
+                logger.warning(f"[{done}/{len(issuers)}] No data found for {issuer}")
+                continue
+            if save:
+                for period_name, (df_analyzed, state, state_date) in results.items():
+                    save_results(df_analyzed, issuer, period_name, state, state_date, staging=staging)
+            logger.info(f"[{done}/{len(issuers)}] {issuer}: {sum(len(df) for df, _, _ in results.values())} rows "
+                        f"over {len(results)} time periods in {seconds:.2f}s")
+    logger.info(f"Analyzed {len(issuers)} issuers in {time.perf_counter() - started:.2f}s")
+
 def main():
+    parser = argparse.ArgumentParser(description="Technical analysis for every issuer and time period")
+    parser.add_argument('--issuers', nargs='+', help="issuer codes, all issuers in the database by default")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--no-save', action='store_true', help="only compute, don't write analysis_results")
+    parser.add_argument('--full', action='store_true', help="recompute the whole history instead of only new bars")
+    parser.add_argument('--staging', action='store_true', help="upsert through a temp staging table")
+    args = parser.parse_args()
+
     # Create analysis table
-    #create_analysis_table()
+    if not args.no_save:
+        create_analysis_table()
     
     # Get list of issuers
-    #issuers = get_issuers()
-    issuers=['ALK']
+    issuers = args.issuers or get_issuers()
     logger.info(f"Found {len(issuers)} issuers to process")
-    
-    for issuer in issuers:
-        logger.info(f"Processing issuer: {issuer}")
-        
-        # Load data
-        df = load_data(issuer)
-        if df.empty:
-            logger.warning(f"No data found for {issuer}")
-            continue
-            
-        # Process different time periods
-        time_periods = {
-            '1 Day': 'D',  # Daily
-            '1 Week': 'W',  # Weekly
-            '1 Month': 'ME'  # Monthly
-        }
-        
-        for period_name, period_code in time_periods.items():
-            logger.info(f"Processing {period_name} data for {issuer}")
-            
-            # Resample and calculate indicators
-            df_resampled = resample_data(df, period_code)
-            if df_resampled.empty:
-                continue
-                
-            df_analyzed = calculate_indicators_and_generate_signals(df_resampled)
-            
-            # Save results
-            #save_results(df_analyzed, issuer, period_name)
-            print (df_analyzed)
+    run_batch(issuers, workers=args.workers, save=not args.no_save, incremental=not args.full,
+              staging=args.staging)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# technical_analysis is a script, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
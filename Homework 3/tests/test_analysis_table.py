@@ -0,0 +1,90 @@
+import sqlite3
+import pytest
+import technical_analysis as analysis
+from indicator_engine import synthetic_prices
+
+# analysis_results as the first version of create_analysis_table made it, before the WilliamsR..CCI columns
+PRE_SERIES_SCHEMA = '''
+CREATE TABLE analysis_results (
+    date DATE, issuer TEXT, time_period TEXT,
+    last_trade_price FLOAT, max FLOAT, min FLOAT, volume FLOAT,
+    RSI FLOAT, STOCH FLOAT, MACD FLOAT, Signal_Line FLOAT, SMA FLOAT, EMA FLOAT,
+    RSI_Signal TEXT, STOCH_Signal TEXT, MACD_Signal TEXT,
+    PRIMARY KEY (date, issuer, time_period)
+)
+'''
+PRE_SERIES_COLUMNS = ['last_trade_price', 'max', 'min', 'volume', 'RSI', 'STOCH', 'MACD', 'Signal_Line', 'SMA', 'EMA',
+                      'RSI_Signal', 'STOCH_Signal', 'MACD_Signal']
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # technical_analysis opens updated_stocks_database.db in the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / 'updated_stocks_database.db'
+
+def analyzed(rows=60):
+    # indexed by date like the frames load_data returns
+    return analysis.calculate_indicators_and_generate_signals(synthetic_prices(rows).rename_axis('date'))
+
+def table_rows(database):
+    conn = sqlite3.connect(database)
+    rows = conn.execute('SELECT date, issuer, time_period, last_trade_price, CCI FROM analysis_results '
+                        'ORDER BY date, issuer, time_period').fetchall()
+    conn.close()
+    return rows
+
+def legacy_frame(df, issuer='ALK', period='1 Day'):
+    """df the way the old save_results wrote it with to_sql"""
+    df = df.reset_index()[['date'] + PRE_SERIES_COLUMNS]
+    df['issuer'] = issuer
+    df['time_period'] = period
+    return df
+
+@pytest.mark.parametrize('staging', [False, True])
+def test_save_into_pre_series_table(database, staging):
+    conn = sqlite3.connect(database)
+    conn.execute(PRE_SERIES_SCHEMA)
+    conn.close()
+
+    analysis.create_analysis_table()
+    df = analyzed()
+    analysis.save_results(df.copy(), 'ALK', '1 Day', staging=staging)
+
+    conn = sqlite3.connect(database)
+    columns = [column[1] for column in conn.execute('PRAGMA table_info(analysis_results)')]
+    conn.close()
+    assert sorted(columns) == sorted(column for column, _ in analysis.ANALYSIS_COLUMNS)
+    rows = table_rows(database)
+    assert len(rows) == len(df)
+    assert rows[-1][4] == pytest.approx(df['CCI'].iloc[-1])
+
+def test_to_sql_table_with_duplicates(database):
+    df = analyzed()
+    conn = sqlite3.connect(database)
+    # two appends of the same bars, the second with a newer price for the last one
+    legacy_frame(df).to_sql('analysis_results', conn, index=False)
+    newer = legacy_frame(df).tail(1)
+    newer['last_trade_price'] = 123.0
+    newer.to_sql('analysis_results', conn, index=False, if_exists='append')
+    conn.close()
+
+    analysis.create_analysis_table()
+    rows = table_rows(database)
+    assert len(rows) == len(df)
+    assert rows[-1][3] == 123.0
+
+    # the unique index holds and the upsert writes over the old rows instead of adding new ones
+    conn = sqlite3.connect(database)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('INSERT INTO analysis_results (date, issuer, time_period) SELECT date, issuer, time_period '
+                     'FROM analysis_results LIMIT 1')
+    conn.close()
+    analysis.save_results(df.copy(), 'ALK', '1 Day')
+    rows = table_rows(database)
+    assert len(rows) == len(df)
+    assert rows[-1][3] == pytest.approx(df['last_trade_price'].iloc[-1])
+    assert rows[-1][4] == pytest.approx(df['CCI'].iloc[-1])
+
+    # running the migration again changes nothing
+    analysis.create_analysis_table()
+    assert table_rows(database) == rows
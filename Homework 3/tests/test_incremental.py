@@ -0,0 +1,71 @@
+import sqlite3
+import pandas as pd
+import pytest
+import technical_analysis as analysis
+from indicator_engine import synthetic_prices
+
+# transactions as Homework 1's scraper creates it
+TRANSACTIONS = '''
+CREATE TABLE transactions(
+    issuer TEXT, date DATE, last_trade_price REAL, max REAL, min REAL, volume INTEGER, turnover_best INTEGER,
+    PRIMARY KEY (issuer, date)
+)
+'''
+ISSUERS = ('ALK', 'KMB')
+
+def trading_days(rows, seed):
+    """rows business days of prices, as the scraper writes them"""
+    df = synthetic_prices(rows, seed)
+    df.index = pd.bdate_range('2019-01-01', periods=rows)
+    return df
+
+def add_transactions(path, frames, start, stop):
+    conn = sqlite3.connect(path)
+    with conn:
+        if start == 0:
+            conn.execute(TRANSACTIONS)
+        conn.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, 0)', [
+            (issuer, day.date().isoformat(), price, high, low, int(volume))
+            for issuer, df in frames.items()
+            for day, price, high, low, volume in df.iloc[start:stop][['last_trade_price', 'max', 'min', 'volume']]
+                .itertuples(name=None)])
+    conn.close()
+
+def analysis_results(path):
+    conn = sqlite3.connect(path)
+    df = pd.read_sql_query('SELECT * FROM analysis_results ORDER BY issuer, time_period, date', conn)
+    conn.close()
+    return df
+
+def run(workers=1):
+    analysis.create_analysis_table()
+    analysis.run_batch(list(ISSUERS), workers=workers)
+
+# monthly bars only get a state once MACD has warmed up, after 37 months (about 800 trading days),
+# until then every run is a full one
+@pytest.mark.parametrize('steps', [(1200,), (850, 1200), (90, 850, 951, 1200), (1150, 1151, 1152, 1200)])
+def test_incremental_runs_match_a_full_run(tmp_path, monkeypatch, steps):
+    # run_batch opens updated_stocks_database.db in the working directory
+    frames = {issuer: trading_days(1200, seed) for seed, issuer in enumerate(ISSUERS)}
+    full = tmp_path / 'full'
+    full.mkdir()
+    monkeypatch.chdir(full)
+    add_transactions('updated_stocks_database.db', frames, 0, 1200)
+    run()
+    expected = analysis_results('updated_stocks_database.db')
+
+    # the same days arriving in steps that end mid-week and mid-month, each run continuing from the stored state
+    stepped = tmp_path / 'stepped'
+    stepped.mkdir()
+    monkeypatch.chdir(stepped)
+    start = 0
+    incremental_runs = 0
+    for stop in steps:
+        add_transactions('updated_stocks_database.db', frames, start, stop)
+        if start:
+            states = analysis.load_indicator_states()
+            incremental_runs += all((issuer, period) in states for issuer in ISSUERS for period in analysis.TIME_PERIODS)
+        run()
+        start = stop
+    assert incremental_runs == sum(stop >= 850 for stop in steps[:-1])
+    pd.testing.assert_frame_equal(analysis_results('updated_stocks_database.db'), expected, check_exact=False, rtol=1e-9)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ta.trend import ADXIndicator
+from indicator_engine import DEFAULT_WINDOWS, calculate_all, calculate_with_ta, synthetic_prices
+
+pytestmark = pytest.mark.filterwarnings('ignore::RuntimeWarning')
+
+def assert_same_columns(df, windows=None):
+    engine = calculate_all(df, windows)
+    reference = calculate_with_ta(df, windows)
+    assert list(engine.columns) == list(reference.columns)
+    for column in reference:
+        np.testing.assert_allclose(engine[column].to_numpy(), reference[column].to_numpy(),
+                                   rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+# around the windows: RSI/SMA/EMA 2, ROC 12, STOCH/WilliamsR/ADX/ATR 14, BB/CCI 20, MACD 26 + 9, ADX output at 2 * 14
+@pytest.mark.parametrize('rows', [1, 2, 3, 12, 13, 14, 15, 20, 21, 27, 28, 29, 30, 35, 36, 60, 250, 2500])
+def test_matches_ta(rows):
+    assert_same_columns(synthetic_prices(rows, seed=rows))
+
+def test_matches_ta_with_other_windows():
+    windows = {'RSI': 14, 'SMA': 20, 'EMA': 20, 'ADX': 7, 'BB': 10, 'CCI': 14, 'MACD_FAST': 5, 'MACD_SLOW': 10}
+    assert_same_columns(synthetic_prices(300), windows)
+
+def test_matches_ta_on_flat_prices():
+    # zero ranges and zero changes, the divisions by zero have to come out the same as in ta
+    df = synthetic_prices(60)
+    df[['last_trade_price', 'max', 'min']] = 100.0
+    assert_same_columns(df)
+
+@pytest.mark.parametrize('rows', [14, 20, 27])
+def test_short_adx_is_nan(rows):
+    # ta's ADXIndicator can't be computed on fewer than 2 * window bars, the engine leaves the column empty
+    df = synthetic_prices(rows)
+    with pytest.raises((IndexError, ValueError)):
+        ADXIndicator(high=df['max'], low=df['min'], close=df['last_trade_price'], window=DEFAULT_WINDOWS['ADX']).adx()
+    result = calculate_all(df)
+    assert result['ADX'].isna().all()
+    assert not result['RSI'].isna().all()
+
+def test_keeps_the_index():
+    df = synthetic_prices(40).rename_axis('date')
+    pd.testing.assert_index_equal(calculate_all(df).index, df.index)
@@ -1,9 +1,11 @@
 from controllers.controller import DataController
 from flask import Flask, render_template, jsonify, request
+from models.metrics import instrument
 import datetime
 
 # Initialize Flask app
 app = Flask(__name__)
+instrument(app) #request timing and /metrics
 
 controller=DataController() #creates an object from the type DataController
 
@@ -15,7 +17,7 @@ def index():
 @app.route('/api/issuers', methods=['GET'])
 def get_issuers():
     """API endpoint to get list of issuers"""
-    return controller.fetch_issuers()
+    return controller.fetch_issuers(request)
 
 @app.route('/api/getStockData', methods=['GET'])
 def get_stock_data():
@@ -27,6 +29,21 @@ def get_rsi_signals():
     """API endpoint to get RSI signals"""
     return controller.get_rsi_signals(request)
 
+@app.route('/api/getSignals', methods=['GET'])
+def get_signals():
+    """API endpoint to get precomputed indicator values and signals, ?indicator=RSI&timeframe=D|W|M"""
+    return controller.get_signals(request)
+
+@app.route('/api/batch/getStockData', methods=['GET'])
+def get_stock_data_batch():
+    """API endpoint to get stock data for many issuers, ?issuers=ALK,KMB,..."""
+    return controller.get_stock_data_batch(request)
+
+@app.route('/api/batch/getRSISignals', methods=['GET'])
+def get_rsi_signals_batch():
+    """API endpoint to get RSI signals for many issuers, ?issuers=ALK,KMB,..."""
+    return controller.get_rsi_signals_batch(request)
+
 @app.errorhandler(404)
 def not_found_error(error):
     """Handle 404 errors"""
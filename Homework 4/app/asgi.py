@@ -0,0 +1,56 @@
+"""ASGI entry point, run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/api/getRSISignals runs on the event loop: the SQLite read goes to a thread pool and the call to
+signal-service is non-blocking, so waiting requests don't hold a worker. Every other route is the
+Flask app, served on a thread pool through a2wsgi.
+"""
+import json
+import time
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from app import app as flask_app, controller
+from controllers.async_controller import AsyncDataController
+from models.async_data_model import AsyncDataModel
+from models import metrics
+
+# Threads for the Flask routes
+WSGI_THREADS = 16
+
+async_model = AsyncDataModel(controller.model) #shares the Flask app's caches and connection pool
+async_controller = AsyncDataController(async_model)
+
+def timed(route, handler):
+    """Endpoint for an async controller method, timed into the same histograms as the Flask routes"""
+    async def endpoint(request):
+        started = time.perf_counter()
+        route_token = metrics.current_route.set(route)
+        phases_token = metrics.current_phases.set({})
+        try:
+            payload, status = await handler(request.query_params)
+            with metrics.phase('json_serialization'):
+                body = json.dumps(payload)
+            response = Response(body, status_code=status, media_type='application/json')
+            seconds = time.perf_counter() - started
+            metrics.request_duration.observe((request.method, route, str(status)), seconds)
+            response.headers['Server-Timing'] = metrics.server_timing(metrics.current_phases.get(), seconds)
+            return response
+        finally:
+            metrics.current_route.reset(route_token)
+            metrics.current_phases.reset(phases_token)
+    return endpoint
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_model.aclose()
+
+app = Starlette(
+    routes=[
+        Route('/api/getRSISignals', timed('/api/getRSISignals', async_controller.get_rsi_signals), methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,66 @@
+from datetime import datetime
+from controllers.controller import MIN_POINTS, parse_max_points
+from models.cache import AsyncSingleFlight
+from models.downsampling import lttb_records
+from models import metrics
+
+class AsyncDataController:
+    """The chart endpoint for the ASGI mode, awaiting the model instead of holding a worker.
+    Methods take the query arguments and return (payload, status), asgi.py builds the response."""
+    def __init__(self, model):
+        self.model = model
+        # identical chart queries awaited at the same time share one DB read and one signal-service call
+        self.rsi_flights = AsyncSingleFlight()
+        metrics.register_collector(self.collect_metrics)
+
+    async def get_rsi_signals(self, args):
+        try:
+            # Get parameters
+            issuer = args.get('issuer')
+            from_date = args.get('from')
+            to_date = args.get('to')
+
+            if not all([issuer, from_date, to_date]):
+                return {"error": "Missing required parameters"}, 400
+
+            # Validate dates
+            try:
+                from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+                to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+            except ValueError:
+                return {"error": "Invalid date format. Use YYYY-MM-DD"}, 400
+            try:
+                max_points = parse_max_points(args)
+            except ValueError:
+                return {"error": f"max_points must be a whole number of at least {MIN_POINTS}"}, 400
+
+            # Fetch data and calculate signals, once for all identical requests in flight
+            signals = await self.rsi_flights.do((issuer, from_date, to_date), self.compute_rsi_signals,
+                                                issuer, from_date, to_date)
+            if signals is None:
+                return {"error": f"No data found for {issuer} between {from_date} and {to_date}"}, 404
+            if not signals:
+                return {"error": "Error calculating signals"}, 500
+
+            return lttb_records(signals, max_points, ("last_trade_price", "RSI")), 200
+        except Exception as e:
+            import traceback
+            print(f"Error in get_rsi_signals: {str(e)}")
+            print(traceback.format_exc())
+            return {"error": str(e)}, 500
+
+    async def compute_rsi_signals(self, issuer, from_date, to_date):
+        """RSI signals for the range, None when there is no data, [] when they couldn't be calculated"""
+        raw_data = await self.model.fetch_stock_data_from_db(issuer, from_date, to_date)
+        if not raw_data:
+            return None
+        return await self.model.calculate_rsi_signals(raw_data)
+
+    def collect_metrics(self):
+        """Request coalescing statistics for /metrics, the ASGI route's counterpart of DataController's"""
+        flights = self.rsi_flights.stats()
+        return {
+            "rsi_signals_async_computations_total": flights["calls"],
+            "rsi_signals_async_coalesced_total": flights["shared"],
+            "rsi_signals_async_in_flight": flights["in_flight"],
+        }
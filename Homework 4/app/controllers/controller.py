@@ -1,16 +1,38 @@
-from flask import render_template, jsonify
-from models.data_model import DataModel
+from flask import render_template, jsonify, Response
+from models.data_model import DataModel, TIMEFRAMES, PRECOMPUTED_INDICATORS, MAX_BATCH_ISSUERS
+from models.downsampling import lttb_records, ohlc_records, iter_ohlc_records
+from models.cache import SingleFlight
+from models import metrics
 from datetime import datetime, timedelta
+import itertools
+import json
+import zlib
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Smallest max_points a chart can ask for, LTTB always keeps the first and the last point
+MIN_POINTS = 3
+
+# Seconds a browser may reuse the issuer list before revalidating it with its ETag
+ISSUERS_MAX_AGE = 300
 
 class DataController:
     def __init__(self):
         self.model = DataModel()
+        # identical chart queries running at the same time share one DB read and one signal-service call
+        self.rsi_flights = SingleFlight()
+        metrics.register_collector(self.collect_metrics)
 
-    def fetch_issuers(self):
-        issuers = self.model.fetch_issuers_from_db()
-        if not issuers:
+    def fetch_issuers(self, request):
+        """Issuer list from memory, browsers revalidate with If-None-Match and get a 304 while it is unchanged"""
+        body, etag = self.model.get_issuers()
+        if etag is None:
             return jsonify({"error": "No issuers found"}), 404
-        return jsonify(issuers)
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = ISSUERS_MAX_AGE
+        return response.make_conditional(request)
     
     def get_rsi_signals(self, request):
         try:
@@ -28,18 +50,21 @@ class DataController:
                 to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
             except ValueError:
                 return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+            try:
+                max_points = parse_max_points(request.args)
+            except ValueError:
+                return jsonify({"error": f"max_points must be a whole number of at least {MIN_POINTS}"}), 400
 
-            # Fetch data
-            raw_data = self.model.fetch_stock_data_from_db(issuer, from_date, to_date)
-            if not raw_data:
+            # Fetch data and calculate signals, once for all identical requests in flight
+            signals = self.rsi_flights.do((issuer, from_date, to_date), self.compute_rsi_signals,
+                                          issuer, from_date, to_date)
+            if signals is None:
                 return jsonify({"error": f"No data found for {issuer} between {from_date} and {to_date}"}), 404
-
-            # Calculate signals
-            signals = self.model.calculate_rsi_signals(raw_data)
             if not signals:
                 return jsonify({"error": "Error calculating signals"}), 500
 
-            return jsonify(signals)
+            # RSI is calculated on every day first, only the points sent to the chart are thinned out
+            return jsonify(lttb_records(signals, max_points, ("last_trade_price", "RSI")))
         except Exception as e:
             #return jsonify({"error": str(e)}), 500
             import traceback
@@ -47,6 +72,58 @@ class DataController:
             print(traceback.format_exc())
             return jsonify({"error": str(e)}), 500
         
+    def compute_rsi_signals(self, issuer, from_date, to_date):
+        """RSI signals for the range, None when there is no data, [] when they couldn't be calculated"""
+        raw_data = self.model.fetch_stock_data_from_db(issuer, from_date, to_date)
+        if not raw_data:
+            return None
+        return self.model.calculate_rsi_signals(raw_data)
+
+    def collect_metrics(self):
+        """Request coalescing statistics for /metrics"""
+        flights = self.rsi_flights.stats()
+        return {
+            "rsi_signals_computations_total": flights["calls"],
+            "rsi_signals_coalesced_total": flights["shared"],
+            "rsi_signals_in_flight": flights["in_flight"],
+        }
+
+    def get_signals(self, request):
+        """Precomputed indicator values and signals for an indicator and timeframe"""
+        try:
+            issuer = request.args.get('issuer')
+            from_date = request.args.get('from')
+            to_date = request.args.get('to')
+            indicator = request.args.get('indicator', 'RSI')
+            timeframe = request.args.get('timeframe', 'D')
+
+            if not all([issuer, from_date, to_date]):
+                return jsonify({"error": "Missing required parameters"}), 400
+            if indicator not in PRECOMPUTED_INDICATORS:
+                return jsonify({"error": f"Unknown indicator. Use one of {', '.join(PRECOMPUTED_INDICATORS)}"}), 400
+            if timeframe not in TIMEFRAMES:
+                return jsonify({"error": f"Unknown timeframe. Use one of {', '.join(TIMEFRAMES)}"}), 400
+
+            try:
+                from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+                to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+            try:
+                max_points = parse_max_points(request.args)
+            except ValueError:
+                return jsonify({"error": f"max_points must be a whole number of at least {MIN_POINTS}"}), 400
+
+            signals = self.model.fetch_precomputed_signals(issuer, from_date, to_date, indicator, timeframe)
+            if signals is None:
+                return jsonify({"error": "Error fetching signals"}), 500
+            if not signals:
+                return jsonify({"error": f"No {indicator} values for {issuer} between {from_date} and {to_date}"}), 404
+
+            return jsonify(lttb_records(signals, max_points, ("last_trade_price", indicator)))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
     def get_stock_data(self, request):
         """API endpoint to get stock data"""
         try:
@@ -62,11 +139,149 @@ class DataController:
                 to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
             except ValueError:
                 return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+            try:
+                max_points = parse_max_points(request.args)
+            except ValueError:
+                return jsonify({"error": f"max_points must be a whole number of at least {MIN_POINTS}"}), 400
+
+            # ?stream=ndjson (or Accept: application/x-ndjson) or ?stream=json sends the range in chunks
+            stream = request.args.get('stream')
+            if stream is None and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+                stream = 'ndjson'
+            if stream is not None:
+                if stream not in ('ndjson', 'json'):
+                    return jsonify({"error": "Invalid stream format. Use ndjson or json"}), 400
+                return self.stream_stock_data(request, issuer, from_date, to_date, stream, max_points)
 
             data = self.model.fetch_stock_data_from_db(issuer, from_date, to_date)
             if not data:
                 return jsonify({"error": f"No data found for {issuer} between {from_date} and {to_date}"}), 404
 
-            return jsonify(data)
+            return jsonify(ohlc_records(data, max_points))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def get_stock_data_batch(self, request):
+        """Stock data for many issuers, ?issuers=ALK,KMB,... -> {issuer: rows}"""
+        try:
+            from_date = request.args.get('from')
+            to_date = request.args.get('to')
+            try:
+                issuers = parse_issuers(request.args)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if not all([from_date, to_date]):
+                return jsonify({"error": "Missing required parameters"}), 400
+
+            try:
+                from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+                to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+            try:
+                max_points = parse_max_points(request.args)
+            except ValueError:
+                return jsonify({"error": f"max_points must be a whole number of at least {MIN_POINTS}"}), 400
+
+            data_by_issuer = self.model.fetch_stock_data_batch(issuers, from_date, to_date)
+            if not data_by_issuer:
+                return jsonify({"error": f"No data found for these issuers between {from_date} and {to_date}"}), 404
+
+            return jsonify({issuer: ohlc_records(data, max_points) for issuer, data in data_by_issuer.items()})
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
\ No newline at end of file
+            return jsonify({"error": str(e)}), 500
+
+    def get_rsi_signals_batch(self, request):
+        """RSI signals for many issuers with one database query and one signal-service call,
+        ?issuers=ALK,KMB,... -> {issuer: signals}"""
+        try:
+            from_date = request.args.get('from')
+            to_date = request.args.get('to')
+            try:
+                issuers = parse_issuers(request.args)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if not all([from_date, to_date]):
+                return jsonify({"error": "Missing required parameters"}), 400
+
+            try:
+                from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+                to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+            try:
+                max_points = parse_max_points(request.args)
+            except ValueError:
+                return jsonify({"error": f"max_points must be a whole number of at least {MIN_POINTS}"}), 400
+
+            data_by_issuer = self.model.fetch_stock_data_batch(issuers, from_date, to_date)
+            if not data_by_issuer:
+                return jsonify({"error": f"No data found for these issuers between {from_date} and {to_date}"}), 404
+
+            signals_by_issuer = self.model.calculate_rsi_signals_batch(data_by_issuer)
+            if not signals_by_issuer:
+                return jsonify({"error": "Error calculating signals"}), 500
+
+            return jsonify({issuer: lttb_records(signals, max_points, ("last_trade_price", "RSI"))
+                            for issuer, signals in signals_by_issuer.items()})
+        except Exception as e:
+            import traceback
+            print(f"Error in get_rsi_signals_batch: {str(e)}")
+            print(traceback.format_exc())
+            return jsonify({"error": str(e)}), 500
+
+    def stream_stock_data(self, request, issuer, from_date, to_date, stream, max_points=None):
+        """Chunked response written while the cursor is read, gzipped per chunk when the client accepts it.
+        With max_points every bar is sent once its period is read."""
+        chunks = self.model.iter_stock_data(issuer, from_date, to_date)
+        if max_points:
+            chunks = iter_ohlc_records(chunks, max_points, to_date)
+        first = next(chunks, None)
+        if first is None:
+            return jsonify({"error": f"No data found for {issuer} between {from_date} and {to_date}"}), 404
+        body = encode_chunks(itertools.chain([first], chunks), stream)
+        gzip = request.accept_encodings['gzip'] > 0
+        response = Response(gzip_chunks(body) if gzip else body,
+                            mimetype=NDJSON_MIMETYPE if stream == 'ndjson' else 'application/json')
+        if gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+def parse_max_points(args):
+    """?max_points=N as an int, None when it isn't given, ValueError when it isn't a usable number"""
+    value = args.get('max_points')
+    if value is None:
+        return None
+    value = int(value)
+    if value < MIN_POINTS:
+        raise ValueError(f"max_points below {MIN_POINTS}")
+    return value
+
+def parse_issuers(args):
+    """?issuers=ALK,KMB as a list without blanks or repeats, ValueError when it is empty or too long"""
+    issuers = list(dict.fromkeys(issuer.strip() for issuer in args.get('issuers', '').split(',') if issuer.strip()))
+    if not issuers:
+        raise ValueError("Missing required parameters")
+    if len(issuers) > MAX_BATCH_ISSUERS:
+        raise ValueError(f"At most {MAX_BATCH_ISSUERS} issuers per request")
+    return issuers
+
+def encode_chunks(chunks, stream):
+    """One NDJSON line per row, or the pieces of a single JSON array"""
+    if stream == 'ndjson':
+        for rows in chunks:
+            yield ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+        return
+    separator = '['
+    for rows in chunks:
+        yield (separator + ','.join(json.dumps(row) for row in rows)).encode('utf-8')
+        separator = ','
+    yield b']'
+
+def gzip_chunks(pieces):
+    """Gzip a stream, flushing after every piece so the browser can decompress it as it arrives"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) #31: gzip header and trailer
+    for piece in pieces:
+        yield compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from models.async_signal_client import AsyncSignalServiceClient
+from models.signal_client import CircuitOpenError
+from models.data_model import (SIGNAL_REQUEST_HEADERS, signal_request_payload, signal_response_records,
+                               calculate_signals_locally_batch)
+from models.metrics import phase
+
+# Threads for the blocking SQLite reads, the event loop itself never waits on the database
+DB_THREADS = int(os.environ.get('DB_THREADS', 16))
+
+class AsyncDataModel:
+    """Awaitable DataModel for the ASGI mode. SQLite reads run on a thread pool and the call to
+    signal-service goes through a non-blocking client; the caches and connection pool are DataModel's."""
+    def __init__(self, model, db_threads=DB_THREADS):
+        self.model = model
+        self.executor = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix="db")
+        # one breaker for both clients, they call the same service
+        self.signal_client = AsyncSignalServiceClient(model.signal_service_url, breaker=model.signal_client.breaker)
+        model.signal_clients.append(self.signal_client) #its calls show up in the signal_client_* metrics
+
+    async def run_blocking(self, function, *args):
+        """Run a blocking model call on the database threads, with the request's metrics context"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, function, *args))
+
+    async def fetch_stock_data_from_db(self, issuer, from_date, to_date):
+        return await self.run_blocking(self.model.fetch_stock_data_from_db, issuer, from_date, to_date)
+
+    async def calculate_rsi_signals(self, data):
+        """Calculate RSI and generate trading signals"""
+        try:
+            if not data:
+                return []
+            issuer = data[0]["issuer"]
+            return (await self.calculate_rsi_signals_batch({issuer: data})).get(issuer, [])
+        except Exception as e:
+            print(f"Error calculating RSI signals: {e}")
+            return []
+
+    async def calculate_rsi_signals_batch(self, data_by_issuer):
+        """Calculate RSI signals for many issuers with one columnar call, {issuer: rows} -> {issuer: signals}"""
+        payload = signal_request_payload(data_by_issuer)
+        if payload is None:
+            return {}
+        try:
+            with phase("signal_service_call"):
+                response = await self.signal_client.post(payload, headers=SIGNAL_REQUEST_HEADERS)
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            print(f"Signal service unavailable, calculating RSI locally: {e}")
+            return await self.run_blocking(calculate_signals_locally_batch, data_by_issuer)
+        return signal_response_records(response.content)
+
+    async def aclose(self):
+        await self.signal_client.aclose()
+        self.executor.shutdown(wait=False)
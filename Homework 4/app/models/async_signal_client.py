@@ -0,0 +1,38 @@
+import asyncio
+import time
+import httpx
+from models.signal_client import ServiceClientStats, RETRY_STATUSES
+
+class AsyncSignalServiceClient(ServiceClientStats):
+    """Non-blocking signal-service client for the ASGI mode, same timeouts, retries, breaker and stats as
+    SignalServiceClient, so one event loop can keep hundreds of calls in flight"""
+    def __init__(self, url, connect_timeout=2.0, read_timeout=10.0, retries=2, pool_size=100, breaker=None):
+        super().__init__(url, breaker)
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=retries), #connection errors, statuses are retried below
+        )
+
+    async def post(self, data, headers=None):
+        """POST to the service and return the response, raises on errors and while the circuit is open"""
+        self.reject_if_open()
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                response = await self.client.post(self.url, content=data, headers=headers)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    break
+                await asyncio.sleep(0.2 * 2 ** attempt)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            self._record(time.perf_counter() - started, failed=True)
+            raise
+        self.breaker.record_success()
+        self._record(time.perf_counter() - started, failed=False)
+        return response
+
+    async def aclose(self):
+        await self.client.aclose()
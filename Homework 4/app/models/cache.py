@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import asyncio
+import threading
+import time
+
+class ResponseCache:
+    """Thread-safe LRU cache with a TTL, every entry remembers the data version it was built from"""
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict() #key -> (expires_at, version, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Return the cached value, or None if it is missing, expired or built from older data"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+class SingleFlight:
+    """Runs one call per key at a time, concurrent callers with the same key wait and share its result.
+    Nothing is kept after the call returns, that is what ResponseCache is for."""
+    def __init__(self):
+        self.calls = {} #key -> [done event, result, exception]
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, function, *args):
+        """Return function(*args), or the result of the identical call already in flight.
+        An exception is raised in every caller that waited for it."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = [threading.Event(), None, None]
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = function(*args)
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call[0].set()
+
+    def stats(self):
+        with self.lock:
+            return {"calls": self.leaders, "shared": self.shared, "in_flight": len(self.calls)}
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop, concurrent awaiters with the same key share one task"""
+    def __init__(self):
+        self.calls = {} #key -> asyncio.Task
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, function, *args):
+        """Return await function(*args), or the result of the identical call already in flight.
+        An exception is raised in every caller that awaited it."""
+        task = self.calls.get(key)
+        if task is None:
+            task = self.calls[key] = asyncio.ensure_future(self._run(key, function, *args))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        # a caller that disconnects doesn't cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _run(self, key, function, *args):
+        try:
+            return await function(*args)
+        finally:
+            del self.calls[key]
+
+    def stats(self):
+        return {"calls": self.leaders, "shared": self.shared, "in_flight": len(self.calls)}
@@ -0,0 +1,77 @@
+import json
+import struct
+import numpy as np
+
+# Wire format for the main-app <-> signal-service hop, negotiated with Content-Type/Accept.
+# Layout: uint32 header length | JSON header | one packed little-endian buffer per column.
+# The header lists the columns (name, type), the row groups (one per issuer, in order) and
+# optional request/response parameters (e.g. the indicator specs for signal-service).
+# Types: "f8" float64, "date" int32 days since 1970-01-01, "category" uint8 codes + categories.
+# Keep this file identical to signal_processing_service/columnar.py.
+CONTENT_TYPE = 'application/x-columnar'
+
+ITEM_SIZES = {"f8": 8, "date": 4, "category": 1}
+
+def encode(columns, groups=None, params=None):
+    """Pack {name: sequence} into bytes, groups is a list of {"issuer": ..., "rows": n}"""
+    header = {"rows": 0, "columns": [], "groups": groups or []}
+    if params:
+        header["params"] = params
+    buffers = []
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if values.dtype.kind == 'O':
+            try:
+                values = np.array(values.tolist(), dtype='<f8') #numbers with None/NaN gaps
+            except (TypeError, ValueError):
+                values = values.astype(str)
+        header["rows"] = len(values)
+        if name == 'date' or np.issubdtype(values.dtype, np.datetime64):
+            header["columns"].append({"name": name, "type": "date"})
+            buffers.append(values.astype('datetime64[D]').astype('<i4').tobytes())
+        elif values.dtype.kind in 'UST':
+            categories, codes = np.unique(values, return_inverse=True)
+            if len(categories) > 255:
+                raise ValueError(f"Too many categories in column {name}")
+            header["columns"].append({"name": name, "type": "category", "categories": categories.tolist()})
+            buffers.append(codes.astype('u1').tobytes())
+        else:
+            header["columns"].append({"name": name, "type": "f8"})
+            buffers.append(values.astype('<f8').tobytes())
+    header_bytes = json.dumps(header).encode('utf-8')
+    return struct.pack('<I', len(header_bytes)) + header_bytes + b''.join(buffers)
+
+def decode(payload):
+    """Unpack bytes from encode into ({name: numpy array}, groups)"""
+    header, offset = read_header(payload)
+    rows = header["rows"]
+    columns = {}
+    for column in header["columns"]:
+        kind = column["type"]
+        if kind == "date":
+            values = np.frombuffer(payload, dtype='<i4', count=rows, offset=offset).astype('datetime64[D]')
+        elif kind == "category":
+            codes = np.frombuffer(payload, dtype='u1', count=rows, offset=offset)
+            values = np.asarray(column["categories"], dtype=object)[codes] if rows else np.empty(0, dtype=object)
+        else:
+            values = np.frombuffer(payload, dtype='<f8', count=rows, offset=offset)
+        columns[column["name"]] = values
+        offset += rows * ITEM_SIZES[kind]
+    return columns, header["groups"]
+
+def read_header(payload):
+    """The JSON header and the offset of the first column buffer"""
+    header_length = struct.unpack_from('<I', payload)[0]
+    return json.loads(payload[4:4 + header_length].decode('utf-8')), 4 + header_length
+
+def params(payload):
+    """The parameters encode was given, {} when there were none"""
+    return read_header(payload)[0].get("params", {})
+
+def split_groups(columns, groups):
+    """Yield (issuer, {name: array slice}) for every row group"""
+    start = 0
+    for group in groups:
+        end = start + group["rows"]
+        yield group["issuer"], {name: values[start:end] for name, values in columns.items()}
+        start = end
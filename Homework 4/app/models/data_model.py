@@ -1,7 +1,50 @@
+import hashlib
+import itertools
+import json
+import os
 import sqlite3
+import threading
+import time
+from datetime import timedelta
+import numpy as np
 import pandas as pd
 import requests
 from models.database_factory import DatabaseFactory
+from models import columnar
+from models.indicators import rsi_signal_columns
+from models.signal_client import SignalServiceClient, CircuitOpenError
+from models.cache import ResponseCache
+from models import metrics
+from models.metrics import phase
+
+# How often the background thread looks for issuers the scraper added
+ISSUER_POLL_SECONDS = 60
+
+# Timeframes of the analysis_results rows Homework 3/technical_analysis.py writes: (time_period, pandas frequency)
+TIMEFRAMES = {'D': ('1 Day', 'D'), 'W': ('1 Week', 'W'), 'M': ('1 Month', 'ME')}
+# Precomputed indicator columns and their signal column, None for indicators without one
+PRECOMPUTED_INDICATORS = {
+    'RSI': 'RSI_Signal', 'STOCH': 'STOCH_Signal', 'MACD': 'MACD_Signal',
+    'SMA': None, 'EMA': None, 'WilliamsR': None, 'ROC': None, 'ADX': None, 'ATR': None, 'CCI': None,
+}
+# RSI window technical_analysis uses, the on-demand fallback has to match it
+ANALYSIS_RSI_WINDOW = 2
+# Days of history per bar loaded in front of an on-demand range so the RSI smoothing has settled
+LOOKBACK_DAYS_PER_BAR = {'D': 2, 'W': 7, 'M': 31}
+
+# Most issuers one batch request may ask for, the whole exchange lists about 200
+MAX_BATCH_ISSUERS = 300
+
+# Rows per chunk when getStockData streams a range
+STREAM_CHUNK_ROWS = 500
+
+STOCK_DATA_QUERY = """
+SELECT issuer, date, last_trade_price, max, min, volume, turnover_best
+FROM transactions
+WHERE issuer = ? 
+AND date BETWEEN ? AND ?
+ORDER BY date
+"""
 
 def format_price(price):
         """Convert price string to float with robust error handling"""
@@ -15,67 +58,135 @@ def format_price(price):
         except ValueError:
             return 0.0
 
+def stock_data_record(row):
+    """One transactions row as the dict the API returns"""
+    return {
+        "issuer": row[0],
+        "date": row[1],
+        "last_trade_price": format_price(row[2]),
+        "max": format_price(row[3]),
+        "min": format_price(row[4]),
+        "volume": row[5],
+        "turnover_best": row[6]
+    }
+
+def period_end(date, freq):
+    """Label of the analysis_results bar holding date: the date itself for days, else the end of its week or month"""
+    return pd.tseries.frequencies.to_offset(freq).rollforward(pd.Timestamp(date)).date()
+
 class DataModel:
     def __init__(self):
-        # Initialize with SQLite database
-        self.db = DatabaseFactory.get_database("sqlite", "updated_stocks_database.db")
-        self.signal_service_url = 'http://signal-service:5001/process' #defines url of the service you wanna call
+        # Initialize with SQLite database, the API only reads so it gets the pooled read-only connections
+        # the indexes and the issuers table come from the deploy step, python -m models.schema
+        self.db = DatabaseFactory.get_database("sqlite", "updated_stocks_database.db", read_only=True)
+        # optional memory-mapped copy of the price history, built with python -m models.timeseries_store
+        store_path = os.environ.get('STOCK_DATA_STORE')
+        self.series_store = DatabaseFactory.get_database("columnar", store_path) if store_path else None
+        self.stock_data_cache = ResponseCache(max_entries=256, ttl_seconds=300)
+        self.signal_service_url = os.environ.get('SIGNAL_SERVICE_URL', 'http://signal-service:5001') + '/process' #defines url of the service you wanna call
         #self.signal_service_url = 'http://localhost:5001/process' #defines url of the service you wanna call
+        self.signal_client = SignalServiceClient(self.signal_service_url)
+        self.signal_clients = [self.signal_client] #every client calling the service, counted together on /metrics
+        metrics.register_collector(self.collect_metrics)
+        # issuer list kept in memory as ready JSON, reloaded by start_issuer_watcher when it changes
+        self.issuers_lock = threading.Lock()
+        self.issuers = []
+        self.issuers_json = b"[]"
+        self.issuers_etag = None
+        self.refresh_issuers()
+        self.start_issuer_watcher()
     
     def get_db_connection(self):
-        """Create a database connection using the factory"""
-        return self.db.connect()
+        """Borrow a pooled database connection from the factory, use it in a with block"""
+        return self.db.connection()
     
     def fetch_issuers_from_db(self):
         """Fetch unique issuers from database with error handling"""
         try:
-            conn = self.get_db_connection()
-            if not conn:
-                return []
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT issuer FROM transactions ORDER BY issuer")
-            issuers = cursor.fetchall()
-            conn.close()
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return []
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT issuer FROM issuers ORDER BY issuer")
+                except sqlite3.OperationalError:
+                    cursor.execute("SELECT DISTINCT issuer FROM transactions ORDER BY issuer") #schema not applied
+                issuers = cursor.fetchall()
             return [{"code": issuer[0], "name": issuer[0]} for issuer in issuers]
         except sqlite3.Error as e:
             print(f"Error fetching issuers: {e}")
             return []
         
+    def refresh_issuers(self):
+        """Reload the issuer list and rebuild its JSON and ETag if it changed, returns True when it did"""
+        issuers = self.fetch_issuers_from_db()
+        if not issuers or issuers == self.issuers:
+            return False
+        body = json.dumps(issuers).encode("utf-8")
+        with self.issuers_lock:
+            self.issuers = issuers
+            self.issuers_json = body
+            self.issuers_etag = hashlib.sha1(body).hexdigest()
+        print(f"Loaded {len(issuers)} issuers")
+        return True
+
+    def start_issuer_watcher(self, interval=ISSUER_POLL_SECONDS):
+        """Poll the issuers table in a daemon thread so new issuers show up without a restart"""
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_issuers()
+                except Exception as e:
+                    print(f"Error refreshing issuers: {e}")
+        threading.Thread(target=watch, name="issuer-watcher", daemon=True).start()
+
+    def get_issuers(self):
+        """The memoized issuer list as (JSON bytes, ETag), nothing is read from the database"""
+        with self.issuers_lock:
+            return self.issuers_json, self.issuers_etag
+
+    def get_data_version(self, conn, issuer):
+        """Per-issuer counter the scraper bumps in the same transaction as every write"""
+        try:
+            row = conn.execute("SELECT data_version FROM ingest_state WHERE issuer = ?", (issuer,)).fetchone()
+        except sqlite3.OperationalError:
+            return 0 #database written before ingest_state existed
+        return row[0] if row else 0
+
     def fetch_stock_data_from_db(self, issuer, from_date, to_date):
-        """Fetch stock data with comprehensive error handling"""
+        """Fetch stock data with comprehensive error handling, served from the cache while the issuer's data is unchanged"""
         try:
-            conn = self.get_db_connection()
-            if not conn:
-                return None
+            issuer = issuer.strip()
+            cache_key = (issuer, str(from_date), str(to_date))
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return None
+
+                version = self.get_data_version(conn, issuer)
+                cached = self.stock_data_cache.get(cache_key, version)
+                if cached is not None:
+                    return cached
 
-            cursor = conn.cursor()
-            query = """
-            SELECT issuer, date, last_trade_price, max, min, volume, turnover_best
-            FROM transactions
-            WHERE issuer = ? 
-            AND date BETWEEN ? AND ?
-            ORDER BY date
-            """
-            
-            cursor.execute(query, (issuer, from_date, to_date))
-            stock_data = cursor.fetchall()
-            conn.close()
+                if self.series_store:
+                    # only while the store was built from the same data the database has now
+                    data = self.fetch_stock_data_from_store(issuer, from_date, to_date, version)
+                    if data is not None:
+                        self.stock_data_cache.put(cache_key, version, data)
+                        return data
+
+                with phase("db_fetch"):
+                    cursor = conn.cursor()
+                    cursor.execute(STOCK_DATA_QUERY, (issuer, from_date, to_date))
+                    stock_data = cursor.fetchall()
 
             if not stock_data:
                 return None
 
-            return [
-                {
-                    "issuer": row[0],
-                    "date": row[1],
-                    "last_trade_price": format_price(row[2]),
-                    "max": format_price(row[3]),
-                    "min": format_price(row[4]),
-                    "volume": row[5],
-                    "turnover_best": row[6]
-                }
-                for row in stock_data
-            ]
+            with phase("row_formatting"):
+                data = [stock_data_record(row) for row in stock_data]
+            self.stock_data_cache.put(cache_key, version, data)
+            return data
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             return None
@@ -83,18 +194,255 @@ class DataModel:
             print(f"Error fetching stock data: {e}")
             return None
         
+    def fetch_stock_data_batch(self, issuers, from_date, to_date):
+        """Stock data for many issuers as {issuer: rows}, issuers without data in the range are left out.
+        Cached and store-backed issuers are served like fetch_stock_data_from_db, the rest come from
+        one indexed query on one connection."""
+        try:
+            issuers = list(dict.fromkeys(issuer.strip() for issuer in issuers))
+            data_by_issuer = {}
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return None
+                versions = self.get_data_versions(conn, issuers)
+                missing = []
+                for issuer in issuers:
+                    data = self.stock_data_cache.get((issuer, str(from_date), str(to_date)), versions[issuer])
+                    if data is None and self.series_store:
+                        data = self.fetch_stock_data_from_store(issuer, from_date, to_date, versions[issuer])
+                        if data is not None:
+                            self.stock_data_cache.put((issuer, str(from_date), str(to_date)), versions[issuer], data)
+                    if data is not None:
+                        data_by_issuer[issuer] = data
+                    else:
+                        missing.append(issuer)
+
+                if missing:
+                    with phase("db_fetch"):
+                        stock_data = conn.execute(stock_data_batch_query(len(missing)),
+                                                  (*missing, from_date, to_date)).fetchall()
+                    with phase("row_formatting"):
+                        for issuer, rows in itertools.groupby(stock_data, key=lambda row: row[0]):
+                            data = [stock_data_record(row) for row in rows]
+                            self.stock_data_cache.put((issuer, str(from_date), str(to_date)), versions[issuer], data)
+                            data_by_issuer[issuer] = data
+
+            # in the order they were asked for
+            return {issuer: data_by_issuer[issuer] for issuer in issuers if issuer in data_by_issuer}
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        except Exception as e:
+            print(f"Error fetching stock data: {e}")
+            return None
+
+    def get_data_versions(self, conn, issuers):
+        """get_data_version for many issuers with one query, {issuer: version}"""
+        try:
+            rows = conn.execute(f"SELECT issuer, data_version FROM ingest_state WHERE issuer IN ({placeholders(len(issuers))})",
+                                issuers).fetchall()
+        except sqlite3.OperationalError:
+            rows = [] #database written before ingest_state existed
+        versions = dict(rows)
+        return {issuer: versions.get(issuer, 0) for issuer in issuers}
+
+    def iter_stock_data(self, issuer, from_date, to_date, chunk_size=STREAM_CHUNK_ROWS):
+        """Yield the stock data in lists of chunk_size rows straight from the cursor, without building the whole range.
+        The pooled connection is held until the generator is exhausted or closed."""
+        issuer = issuer.strip()
+        with self.get_db_connection() as conn:
+            if not conn:
+                return
+            cursor = conn.execute(STOCK_DATA_QUERY, (issuer, from_date, to_date))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [stock_data_record(row) for row in rows]
+
+    def fetch_stock_data_from_store(self, issuer, from_date, to_date, version):
+        """Stock data sliced from the columnar store, None when the store doesn't have this version of the issuer"""
+        with self.series_store.connection() as store:
+            if not version or store.data_version(issuer) != version:
+                return None
+            with phase("store_fetch"):
+                columns = store.range(issuer, from_date, to_date)
+        if columns is None or not len(columns["date"]):
+            return None
+        with phase("row_formatting"):
+            prices = {name: np.nan_to_num(columns[name], nan=0.0).tolist() for name in ("last_trade_price", "max", "min")}
+            counts = {name: [None if value != value else int(value) for value in columns[name].tolist()]
+                      for name in ("volume", "turnover_best")}
+            return [
+                {
+                    "issuer": issuer,
+                    "date": date,
+                    "last_trade_price": last_trade_price,
+                    "max": max_price,
+                    "min": min_price,
+                    "volume": volume,
+                    "turnover_best": turnover_best
+                }
+                for date, last_trade_price, max_price, min_price, volume, turnover_best in zip(
+                    columns["date"].astype(str).tolist(), prices["last_trade_price"], prices["max"], prices["min"],
+                    counts["volume"], counts["turnover_best"])
+            ]
+
+    def collect_metrics(self):
+        """Signal client and cache statistics for /metrics"""
+        clients = [client.stats() for client in self.signal_clients]
+        cache = self.stock_data_cache.stats()
+        return {
+            "signal_client_calls_total": sum(client["calls"] for client in clients),
+            "signal_client_failures_total": sum(client["failures"] for client in clients),
+            "signal_client_rejected_total": sum(client["rejected"] for client in clients),
+            "signal_client_circuit_open": self.signal_client.breaker.state == "open",
+            "stock_data_cache_hits_total": cache["hits"],
+            "stock_data_cache_misses_total": cache["misses"],
+            "stock_data_cache_entries": cache["entries"],
+        }
+
     def calculate_rsi_signals(self, data):
         """Calculate RSI and generate trading signals"""
         try:
             if not data:
                 return []
-            # Convert to records
-            response = requests.post(
-            self.signal_service_url, 
-            json={'data': data}
-            )
-            print("Response from signal processing service ", response)
-            return response.json()['signals']
+            return self.calculate_rsi_signals_batch({data[0]["issuer"]: data}).get(data[0]["issuer"], [])
         except Exception as e:
             print(f"Error calculating RSI signals: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def calculate_rsi_signals_batch(self, data_by_issuer):
+        """Calculate RSI signals for many issuers with one columnar call, {issuer: rows} -> {issuer: signals}"""
+        payload = signal_request_payload(data_by_issuer)
+        if payload is None:
+            return {}
+        try:
+            with phase("signal_service_call"):
+                response = self.signal_client.post(payload, headers=SIGNAL_REQUEST_HEADERS)
+        except (requests.RequestException, CircuitOpenError) as e:
+            print(f"Signal service unavailable, calculating RSI locally: {e}")
+            return calculate_signals_locally_batch(data_by_issuer)
+        return signal_response_records(response.content)
+
+    def fetch_precomputed_signals(self, issuer, from_date, to_date, indicator='RSI', timeframe='D'):
+        """Indicator values and signals from analysis_results, one indexed range scan per request.
+        RSI days after the last materialized bar are calculated on demand the same way the batch job does."""
+        try:
+            issuer = issuer.strip()
+            time_period, freq = TIMEFRAMES[timeframe]
+            signal_column = PRECOMPUTED_INDICATORS[indicator]
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return None
+                try:
+                    with phase("db_fetch"):
+                        # analysis_results dates are stored as 'YYYY-MM-DD 00:00:00', weeks and months under
+                        # the last day of the period, so the bar still in progress on to_date is labelled after it
+                        rows = conn.execute(f"""
+                        SELECT date, last_trade_price, "{indicator}", {f'"{signal_column}"' if signal_column else 'NULL'}
+                        FROM analysis_results
+                        WHERE issuer = ? AND time_period = ? AND date >= ? AND date < ?
+                        ORDER BY date
+                        """, (issuer, time_period, str(from_date), str(period_end(to_date, freq) + timedelta(days=1)))).fetchall()
+                        materialized_to = conn.execute(
+                            "SELECT MAX(date) FROM analysis_results WHERE issuer = ? AND time_period = ?",
+                            (issuer, time_period)
+                        ).fetchone()[0]
+                except sqlite3.OperationalError:
+                    rows, materialized_to = [], None #the batch job has not run on this database yet
+
+            with phase("row_formatting"):
+                signals = [
+                    {"date": row[0][:10], "last_trade_price": row[1], indicator: row[2], "signal": row[3], "source": "precomputed"}
+                    for row in rows
+                ]
+            materialized_to = materialized_to[:10] if materialized_to else None
+            if indicator == 'RSI' and (materialized_to is None or materialized_to < str(to_date)):
+                start = max(from_date, (pd.Timestamp(materialized_to) + timedelta(days=1)).date()) if materialized_to else from_date
+                signals += self.calculate_rsi_on_demand(issuer, start, to_date, timeframe)
+            return signals
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        except Exception as e:
+            print(f"Error fetching precomputed signals: {e}")
+            return None
+
+    def calculate_rsi_on_demand(self, issuer, from_date, to_date, timeframe='D'):
+        """RSI signals for a range analysis_results does not cover yet, with the batch job's window and bars"""
+        _, freq = TIMEFRAMES[timeframe]
+        lookback = timedelta(days=ANALYSIS_RSI_WINDOW * 50 * LOOKBACK_DAYS_PER_BAR[timeframe])
+        data = self.fetch_stock_data_from_db(issuer, from_date - lookback, to_date)
+        if not data:
+            return []
+        bars = (pd.DataFrame(data, columns=["date", "last_trade_price"])
+                .assign(date=lambda df: pd.to_datetime(df["date"]))
+                .set_index("date")["last_trade_price"]
+                .resample(freq).last().dropna())
+        rsi, signal = rsi_signal_columns(bars.to_numpy(), window=ANALYSIS_RSI_WINDOW)
+        keep = bars.index >= pd.Timestamp(from_date)
+        return [
+            {"date": str(date.date()), "last_trade_price": price, "RSI": value, "signal": label, "source": "on_demand"}
+            for date, price, value, label in zip(bars.index[keep], bars.to_numpy()[keep].tolist(),
+                                                 rsi[keep].tolist(), signal[keep].tolist())
+        ]
+
+def placeholders(count):
+    return ", ".join("?" * count)
+
+def stock_data_batch_query(count):
+    """STOCK_DATA_QUERY for count issuers, rows come back grouped by issuer"""
+    return f"""
+    SELECT issuer, date, last_trade_price, max, min, volume, turnover_best
+    FROM transactions
+    WHERE issuer IN ({placeholders(count)})
+    AND date BETWEEN ? AND ?
+    ORDER BY issuer, date
+    """
+
+SIGNAL_REQUEST_HEADERS = {"Content-Type": columnar.CONTENT_TYPE, "Accept": columnar.CONTENT_TYPE}
+
+def signal_request_payload(data_by_issuer):
+    """Columnar request body for signal-service, one row group per issuer, None when there are no rows"""
+    rows = [row for issuer_rows in data_by_issuer.values() for row in issuer_rows]
+    if not rows:
+        return None
+    with phase("row_formatting"):
+        return columnar.encode(
+            {
+                "date": [row["date"] for row in rows],
+                "last_trade_price": [row["last_trade_price"] for row in rows],
+            },
+            groups=[{"issuer": issuer, "rows": len(issuer_rows)} for issuer, issuer_rows in data_by_issuer.items()],
+        )
+
+def signal_response_records(content):
+    """signal-service's columnar response as {issuer: signals}"""
+    with phase("row_formatting"):
+        columns, groups = columnar.decode(content)
+        return {issuer: signals_to_records(group_columns)
+                for issuer, group_columns in columnar.split_groups(columns, groups)}
+
+def calculate_signals_locally_batch(data_by_issuer):
+    with phase("signal_local_fallback"):
+        return {issuer: calculate_signals_locally(issuer_rows) for issuer, issuer_rows in data_by_issuer.items()}
+
+def calculate_signals_locally(rows):
+    """Fallback for when the circuit to signal-service is open, same output as the service"""
+    prices = np.array([row["last_trade_price"] for row in rows], dtype='float64')
+    rsi, signal = rsi_signal_columns(prices)
+    return signals_to_records({
+        "date": np.array([row["date"] for row in rows], dtype='datetime64[D]'),
+        "last_trade_price": prices,
+        "RSI": rsi,
+        "signal": signal,
+    })
+
+def signals_to_records(columns):
+    """Turn the service's signal columns back into the rows the frontend expects"""
+    return [
+        {"date": date, "last_trade_price": price, "RSI": rsi, "signal": signal}
+        for date, price, rsi, signal in zip(columns["date"].astype(str).tolist(), columns["last_trade_price"].tolist(),
+                                            columns["RSI"].tolist(), columns["signal"].tolist())
+    ]
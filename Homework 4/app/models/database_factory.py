@@ -1,37 +1,114 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import queue
 import sqlite3
+import threading
 import pandas as pd
+from models.timeseries_store import ColumnarStore
 
 class DatabaseConnection(ABC):
     @abstractmethod
     def connect(self):
         pass
-    
+
     @abstractmethod
-    def disconnect(self):
+    def disconnect(self, connection):
         pass
 
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.connect()
+        try:
+            yield conn
+        finally:
+            if conn:
+                self.disconnect(conn)
+
 class SQLiteConnection(DatabaseConnection):
-    def __init__(self, db_name):
+    def __init__(self, db_name, read_only=False, pool_size=8, mmap_size=256 * 1024 * 1024, cache_size_kb=64 * 1024):
         self.db_name = db_name
-        self.connection = None
-    
+        self.read_only = read_only
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.pool = queue.LifoQueue(maxsize=pool_size) #idle connections, most recently used first
+
+    def _open(self):
+        if self.read_only:
+            # read-only URI connection, it never takes the write lock so the scraper can't block it
+            conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            # WAL lets readers keep going while a writer commits, the setting is stored in the file
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.row_factory = sqlite3.Row
+        return conn
+
     def connect(self):
+        """Take an idle connection from the pool, or open a new one if none is free"""
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            pass
         try:
-            self.connection = sqlite3.connect(self.db_name)
-            self.connection.row_factory = sqlite3.Row
-            return self.connection
+            return self._open()
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             return None
-    
-    def disconnect(self):
-        if self.connection:
-            self.connection.close()
+
+    def disconnect(self, connection):
+        """Give a connection back to the pool, closing it if the pool is already full"""
+        if not connection:
+            return
+        if connection.in_transaction:
+            connection.rollback()
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+class ColumnarConnection(DatabaseConnection):
+    """Memory-mapped per-issuer arrays built by timeseries_store.build_store, read only"""
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.store = ColumnarStore(db_name)
+
+    def connect(self):
+        """The shared store, with the manifest re-read if the store was rebuilt"""
+        self.store.refresh()
+        return self.store
+
+    def disconnect(self, connection):
+        pass #the memory maps stay open for the next request
 
 class DatabaseFactory:
+    _instances = {}
+    _lock = threading.Lock()
+
     @staticmethod
-    def get_database(db_type, db_name):
+    def get_database(db_type, db_name, read_only=False):
+        """Return the shared connection provider for a database, so every model reuses one pool"""
         if db_type.lower() == "sqlite":
-            return SQLiteConnection(db_name)
+            key = (db_type.lower(), db_name, read_only)
+            with DatabaseFactory._lock:
+                if key not in DatabaseFactory._instances:
+                    DatabaseFactory._instances[key] = SQLiteConnection(db_name, read_only=read_only)
+                return DatabaseFactory._instances[key]
+        if db_type.lower() == "columnar":
+            key = (db_type.lower(), db_name)
+            with DatabaseFactory._lock:
+                if key not in DatabaseFactory._instances:
+                    DatabaseFactory._instances[key] = ColumnarConnection(db_name)
+                return DatabaseFactory._instances[key]
         raise ValueError(f"Unsupported database type: {db_type}")
@@ -0,0 +1,135 @@
+import itertools
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+# Server-side reduction of long ranges to about as many points as the chart can show.
+# Line series use Largest-Triangle-Three-Buckets, price bars are aggregated into calendar periods.
+
+# Calendar periods tried from finest to coarsest when bucketing price bars
+OHLC_FREQUENCIES = ('D', 'W', 'ME', 'QE', 'YE')
+
+def lttb_indices(values, max_points):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps, always the first and the last"""
+    n = len(values)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    # gaps only matter for picking points, they take their neighbour's value
+    y = pd.Series(values, dtype='float64').ffill().bfill().fillna(0.0).to_numpy()
+    x = np.arange(n, dtype='float64')
+    every = (n - 2) / (max_points - 2)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # the triangle's third corner is the average of the next bucket, the last point for the last bucket
+        next_end = min(int((i + 2) * every) + 1, n)
+        if i < max_points - 3:
+            next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+def lttb_records(records, max_points, keys):
+    """Keep the records LTTB picks for every series in keys, splitting max_points between them"""
+    if not max_points or len(records) <= max_points:
+        return records
+    per_series = max(3, max_points // len(keys))
+    keep = set()
+    for key in keys:
+        values = [np.nan if record[key] is None else record[key] for record in records]
+        keep.update(lttb_indices(values, per_series).tolist())
+    return [records[index] for index in sorted(keep)]
+
+def ohlc_records(records, max_points):
+    """Stock rows aggregated into the finest calendar period that fits in max_points bars,
+    with technical_analysis.resample_data's aggregation plus the period's opening price.
+    A bar is dated with the last trading day in it, so it lines up with the rows LTTB keeps."""
+    if not max_points or len(records) <= max_points:
+        return records
+    df = pd.DataFrame(records)
+    df.index = pd.to_datetime(df['date'])
+    for freq in OHLC_FREQUENCIES:
+        if (df['last_trade_price'].resample(freq).count() > 0).sum() <= max_points:
+            return ohlc_bars(df, pd.Grouper(freq=freq))
+    # even yearly bars are too many, use runs of an equal number of trading days instead
+    return ohlc_bars(df, np.arange(len(df)) // -(-len(df) // max_points))
+
+def iter_ohlc_records(chunks, max_points, to_date):
+    """ohlc_records for rows arriving in date-ordered chunks, yielding every bar as soon as it is complete.
+    The rows aren't all there yet, so the period is picked by counting the days from the first row's date
+    to to_date (or today): weekdays, which is what ohlc_records counts as long as the exchange traded on them,
+    or every day when the first chunk has weekend rows. Holidays, halts or an issuer whose rows stop before
+    to_date can still get coarser bars than ohlc_records gives them."""
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return
+    chunks = itertools.chain([first], chunks)
+    first_date, last_date = first[0]['date'], min(pd.Timestamp(to_date), pd.Timestamp.today().normalize())
+    weekdays_only = all(pd.Timestamp(record['date']).dayofweek < 5 for record in first)
+    freq = next((freq for freq in OHLC_FREQUENCIES
+                 if trading_periods(first_date, last_date, freq, weekdays_only) <= max_points), None)
+    if freq == 'D':
+        yield from chunks
+        return
+    if freq is None:
+        # equal runs of trading days need the row count, so this one waits for the whole range
+        yield ohlc_records([record for chunk in chunks for record in chunk], max_points)
+        return
+    pending = []
+    for chunk in chunks:
+        pending.extend(chunk)
+        df = pd.DataFrame(pending)
+        df.index = pd.to_datetime(df['date'])
+        *complete, _ = ohlc_bars(df, pd.Grouper(freq=freq))
+        # the last period can still get rows from the next chunk
+        if complete:
+            pending = [record for record in pending if record['date'] > complete[-1]['date']]
+            yield complete
+    if pending:
+        df = pd.DataFrame(pending)
+        df.index = pd.to_datetime(df['date'])
+        yield ohlc_bars(df, pd.Grouper(freq=freq))
+
+def trading_periods(from_date, to_date, freq, weekdays_only=True):
+    """Upper bound on the bars of freq between two dates, for rows on every weekday (or every day)"""
+    first, last = pd.Timestamp(from_date).date(), pd.Timestamp(to_date).date()
+    if freq == 'D':
+        if not weekdays_only:
+            return max(0, (last - first).days + 1)
+        return max(0, int(np.busday_count(first, last + timedelta(days=1))))
+    days = pd.bdate_range(first, last) if weekdays_only else pd.date_range(first, last)
+    return int((pd.Series(1, index=days).resample(freq).count() > 0).sum()) if len(days) else 0
+
+def ohlc_bars(df, grouper):
+    """One bar dict per group of a date-indexed frame of stock rows"""
+    bars = df.groupby(grouper).agg({
+        'issuer': 'first',
+        'date': 'last',
+        'last_trade_price': ['first', 'last'],
+        'max': 'max',
+        'min': 'min',
+        'volume': 'sum',
+        'turnover_best': 'sum'
+    }).dropna()
+    bars.columns = ['issuer', 'date', 'open', 'last_trade_price', 'max', 'min', 'volume', 'turnover_best']
+    return [
+        {
+            "issuer": row.issuer,
+            "date": row.date,
+            "open": row.open,
+            "last_trade_price": row.last_trade_price,
+            "max": row.max,
+            "min": row.min,
+            "volume": int(row.volume),
+            "turnover_best": int(row.turnover_best)
+        }
+        for row in bars.itertuples(index=False)
+    ]
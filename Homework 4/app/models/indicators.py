@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+def calculate_rsi(prices, window=14):
+    """Wilder RSI with the same smoothing as ta's RSIIndicator, used when signal-service is unavailable"""
+    close = pd.Series(prices, dtype='float64')
+    diff = close.diff(1)
+    up = diff.where(diff > 0, 0.0)
+    down = -diff.where(diff < 0, 0.0)
+    ema_up = up.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+    ema_down = down.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+    rsi = np.where(ema_down == 0, 100, 100 - (100 / (1 + ema_up / ema_down)))
+    return np.asarray(rsi, dtype='float64')
+
+def rsi_signal_columns(prices, window=14):
+    """RSI and Buy/Sell/Hold columns the way signal-service returns them"""
+    rsi = calculate_rsi(prices, window)
+    signal = np.where(rsi < 30, 'Buy', np.where(rsi > 70, 'Sell', 'Hold'))
+    return np.nan_to_num(rsi, nan=50.0), signal
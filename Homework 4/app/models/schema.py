@@ -0,0 +1,109 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+# Indexes and tables for the API's read patterns, applied with ensure_schema by the deploy step
+# (python -m models.schema, see the Dockerfile) rather than by every API worker on import.
+# check_query_plans runs EXPLAIN QUERY PLAN on the hot queries so a schema change that
+# turns one of them back into a full table scan is caught before it is deployed.
+
+STATEMENTS = [
+    # issuers dimension, the issuer dropdown reads it instead of DISTINCT over every transaction
+    """
+    CREATE TABLE IF NOT EXISTS issuers(
+        issuer TEXT PRIMARY KEY
+    )
+    """,
+    # kept in sync by the database itself, whatever process writes the transactions
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_issuer AFTER INSERT ON transactions
+    BEGIN
+        INSERT OR IGNORE INTO issuers (issuer) VALUES (NEW.issuer);
+    END
+    """,
+    # the range scan reads every column, covering it keeps one issuer's days next to each other
+    # instead of spread over the table pages in the order the scraper inserted them
+    """
+    CREATE INDEX IF NOT EXISTS transactions_issuer_date_covering
+    ON transactions (issuer, date, last_trade_price, max, min, volume, turnover_best)
+    """,
+]
+
+# Hot queries and the index each one has to use: (name, sql, params, index)
+EXPECTED_PLANS = [
+    (
+        "issuer list",
+        "SELECT issuer FROM issuers ORDER BY issuer",
+        (),
+        "sqlite_autoindex_issuers_1",
+    ),
+    (
+        "stock data range",
+        """
+        SELECT issuer, date, last_trade_price, max, min, volume, turnover_best
+        FROM transactions
+        WHERE issuer = ?
+        AND date BETWEEN ? AND ?
+        ORDER BY date
+        """,
+        ("ALK", "2020-01-01", "2020-12-31"),
+        "transactions_issuer_date_covering",
+    ),
+    (
+        "batch stock data range",
+        """
+        SELECT issuer, date, last_trade_price, max, min, volume, turnover_best
+        FROM transactions
+        WHERE issuer IN (?, ?, ?)
+        AND date BETWEEN ? AND ?
+        ORDER BY issuer, date
+        """,
+        ("ALK", "KMB", "TTK", "2020-01-01", "2020-12-31"),
+        "transactions_issuer_date_covering",
+    ),
+]
+
+def ensure_schema(conn):
+    """Create the indexes and the issuers table, filling it from transactions the first time"""
+    with conn:
+        for statement in STATEMENTS:
+            conn.execute(statement)
+        if conn.execute("SELECT COUNT(*) FROM issuers").fetchone()[0] == 0:
+            conn.execute("INSERT OR IGNORE INTO issuers (issuer) SELECT DISTINCT issuer FROM transactions")
+    conn.execute("PRAGMA optimize")
+
+def explain(conn, sql, params=()):
+    """The detail lines of EXPLAIN QUERY PLAN for a query"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+def check_query_plans(conn):
+    """Problems with the hot queries' plans, an empty list when all of them use their index"""
+    problems = []
+    for name, sql, params, index in EXPECTED_PLANS:
+        plan = explain(conn, sql, params)
+        if not any(index in line for line in plan):
+            problems.append(f"{name} does not use {index}: {'; '.join(plan)}")
+        if any(line.startswith("SCAN") and "INDEX" not in line for line in plan):
+            problems.append(f"{name} scans the whole table: {'; '.join(plan)}")
+        if any("TEMP B-TREE" in line for line in plan):
+            problems.append(f"{name} sorts in a temp b-tree: {'; '.join(plan)}")
+    return problems
+
+if __name__ == '__main__':
+    # python -m models.schema [database] [--no-check], the deploy step that applies the schema once
+    # before the workers start; exits with 1 if a plan regressed unless --no-check is given
+    parser = argparse.ArgumentParser(description="Apply the API's indexes and check the hot query plans")
+    parser.add_argument('database', nargs='?', default="updated_stocks_database.db")
+    parser.add_argument('--no-check', action='store_true', help="only apply the schema")
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"No database at {args.database}") #connect would create an empty one
+    conn = sqlite3.connect(args.database)
+    ensure_schema(conn)
+    problems = [] if args.no_check else check_query_plans(conn)
+    for problem in problems:
+        print(problem)
+    print("Query plans OK" if not problems else f"{len(problems)} query plan problem(s)")
+    conn.close()
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,124 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the service while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops calling a failing service for reset_timeout seconds after failure_threshold failures in a row.
+    After that a single trial call is let through, the rest keep failing fast until it succeeds or fails."""
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None #when the half-open trial call went out
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open" #the next call is a trial
+            return "open"
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # one trial at a time, a trial that never reported back is given up after reset_timeout
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic() #(re)open, a failed trial call restarts the timeout
+
+# Statuses retried with backoff, the service is restarting or overloaded
+RETRY_STATUSES = (502, 503, 504)
+
+class ServiceClientStats:
+    """Call counters and latency shared by the blocking and the async signal-service clients"""
+    def __init__(self, url, breaker=None):
+        self.url = url
+        self.breaker = breaker or CircuitBreaker()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def reject_if_open(self):
+        """Raise CircuitOpenError instead of calling the service while the circuit is open"""
+        if not self.breaker.allow_request():
+            with self.lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"Circuit open for {self.url}")
+
+    def _record(self, seconds, failed):
+        with self.lock:
+            self.calls += 1
+            self.failures += int(failed)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.last_seconds = seconds
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "avg_ms": self.total_seconds / self.calls * 1000 if self.calls else 0.0,
+                "max_ms": self.max_seconds * 1000,
+                "last_ms": self.last_seconds * 1000,
+                "circuit": self.breaker.state,
+            }
+
+class SignalServiceClient(ServiceClientStats):
+    """Shared keep-alive client for signal-service with timeouts, bounded retries and a circuit breaker"""
+    def __init__(self, url, connect_timeout=2.0, read_timeout=10.0, retries=2, pool_size=10, breaker=None):
+        super().__init__(url, breaker)
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(["POST"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, data, headers=None):
+        """POST to the service and return the response, raises on errors and while the circuit is open"""
+        self.reject_if_open()
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=data, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            self.breaker.record_failure()
+            self._record(time.perf_counter() - started, failed=True)
+            raise
+        self.breaker.record_success()
+        self._record(time.perf_counter() - started, failed=False)
+        return response
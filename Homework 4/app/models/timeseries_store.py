@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import numpy as np
+
+# Per-issuer price history as contiguous typed arrays, one .npy file per column,
+# opened memory-mapped so a range lookup is a binary search on the dates and a zero-copy slice.
+# Layout:
+#   <store>/manifest.json             {"format": 1, "issuers": {code: {"path", "rows", "first_date", "last_date", "data_version"}}}
+#   <store>/<code>.v<data_version>/   date.npy (datetime64[D]) and one float64 .npy per value column
+# An issuer is rewritten into a new directory and the manifest is swapped after it, so readers never see half a write.
+FORMAT_VERSION = 1
+COLUMNS = ('last_trade_price', 'max', 'min', 'volume', 'turnover_best')
+
+class ColumnarStore:
+    """Reader for a store directory, reloads the manifest when build_store replaced it"""
+    def __init__(self, path):
+        self.path = path
+        self.manifest_mtime = None
+        self.manifest = {"issuers": {}}
+        self.series_by_path = {} #issuer directory -> {column: memmapped array}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Re-read the manifest if it changed, a stat() when it did not"""
+        manifest_path = os.path.join(self.path, "manifest.json")
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if mtime == self.manifest_mtime:
+                return
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            self.manifest_mtime = mtime
+            live = {entry["path"] for entry in self.manifest["issuers"].values()}
+            self.series_by_path = {path: series for path, series in self.series_by_path.items() if path in live}
+
+    def issuers(self):
+        return sorted(self.manifest["issuers"])
+
+    def data_version(self, issuer):
+        entry = self.manifest["issuers"].get(issuer)
+        return entry["data_version"] if entry else None
+
+    def series(self, issuer):
+        """{column: array} for the issuer's whole history, None if the store does not have it"""
+        entry = self.manifest["issuers"].get(issuer)
+        if entry is None:
+            return None
+        with self.lock:
+            series = self.series_by_path.get(entry["path"])
+            if series is None:
+                directory = os.path.join(self.path, entry["path"])
+                series = {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+                          for column in ('date',) + COLUMNS}
+                self.series_by_path[entry["path"]] = series
+        return series
+
+    def range(self, issuer, from_date, to_date):
+        """Views of the issuer's columns for from_date <= date <= to_date, None if the store does not have it"""
+        series = self.series(issuer)
+        if series is None:
+            return None
+        dates = series['date']
+        start = np.searchsorted(dates, np.datetime64(str(from_date), 'D'), side='left')
+        end = np.searchsorted(dates, np.datetime64(str(to_date), 'D'), side='right')
+        return {column: values[start:end] for column, values in series.items()}
+
+def write_issuer(store_path, issuer, dates, columns, data_version):
+    """Write one issuer's arrays into a new directory and return its manifest entry"""
+    name = f"{issuer}.v{data_version}"
+    directory = os.path.join(store_path, name)
+    shutil.rmtree(directory, ignore_errors=True) #left over from an interrupted build
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "date.npy"), dates)
+    for column in COLUMNS:
+        np.save(os.path.join(directory, f"{column}.npy"), columns[column])
+    return {
+        "path": name,
+        "rows": len(dates),
+        "first_date": str(dates[0]) if len(dates) else None,
+        "last_date": str(dates[-1]) if len(dates) else None,
+        "data_version": data_version,
+    }
+
+def write_manifest(store_path, manifest):
+    """Replace the manifest atomically"""
+    temp_path = os.path.join(store_path, "manifest.json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, os.path.join(store_path, "manifest.json"))
+
+def build_store(db_name, store_path, issuers=None):
+    """Export transactions into the store, only issuers whose data_version changed are rewritten"""
+    os.makedirs(store_path, exist_ok=True)
+    manifest_path = os.path.join(store_path, "manifest.json")
+    manifest = {"format": FORMAT_VERSION, "issuers": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    conn = sqlite3.connect(db_name)
+    try:
+        versions = dict(conn.execute("SELECT issuer, data_version FROM ingest_state").fetchall())
+    except sqlite3.OperationalError:
+        versions = {} #database written before ingest_state existed
+    if issuers is None:
+        issuers = [row[0] for row in conn.execute("SELECT DISTINCT issuer FROM transactions")]
+    written = 0
+    for issuer in issuers:
+        version = versions.get(issuer) or 0
+        old = manifest["issuers"].get(issuer)
+        if old and old["data_version"] == version and version:
+            continue
+        rows = conn.execute(f"""
+        SELECT date, {', '.join(COLUMNS)} FROM transactions WHERE issuer = ? ORDER BY date
+        """, (issuer,)).fetchall()
+        if not rows:
+            continue
+        if any(isinstance(value, str) for row in rows for value in row[1:]):
+            # text left over from before the numeric migration is parsed on every SQLite read, the store
+            # would answer differently, so the issuer is served from SQLite until it has been migrated
+            print(f"Skipping {issuer}, it still has text values: run Homework 1/migrate_numeric_storage.py first")
+            if old:
+                del manifest["issuers"][issuer]
+                write_manifest(store_path, manifest)
+                shutil.rmtree(os.path.join(store_path, old["path"]), ignore_errors=True)
+            continue
+        dates = np.array([row[0][:10] for row in rows], dtype='datetime64[D]')
+        # empty cells are stored as NULL, they become NaN
+        columns = {column: np.array([np.nan if value is None else value for value in values], dtype='float64')
+                   for column, values in zip(COLUMNS, list(zip(*rows))[1:])}
+        manifest["issuers"][issuer] = write_issuer(store_path, issuer, dates, columns, version)
+        write_manifest(store_path, manifest)
+        if old and old["path"] != manifest["issuers"][issuer]["path"]:
+            shutil.rmtree(os.path.join(store_path, old["path"]), ignore_errors=True)
+        written += 1
+    conn.close()
+    return written
+
+if __name__ == '__main__':
+    # python -m models.timeseries_store <database> <store directory>, run after the scraper
+    db_name = sys.argv[1] if len(sys.argv) > 1 else "updated_stocks_database.db"
+    store_path = sys.argv[2] if len(sys.argv) > 2 else "updated_stocks_columnar"
+    print(f"Wrote {build_store(db_name, store_path)} issuers to {store_path}")
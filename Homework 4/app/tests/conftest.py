@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the app imports its modules as models.* and controllers.* from the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from models.cache import AsyncSingleFlight
+
+def test_concurrent_awaiters_share_one_call():
+    flights = AsyncSingleFlight()
+    started = []
+
+    async def compute(value):
+        started.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        results = await asyncio.gather(*(flights.do('key', compute, 21) for _ in range(10)))
+        assert results == [42] * 10
+        assert flights.calls == {}
+        # a later call runs again, nothing is kept once the flight lands
+        assert await flights.do('key', compute, 1) == 2
+
+    asyncio.run(main())
+    assert started == [21, 1]
+    assert flights.stats() == {"calls": 2, "shared": 9, "in_flight": 0}
+
+def test_exception_reaches_every_awaiter():
+    flights = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("service down")
+
+    async def main():
+        results = await asyncio.gather(*(flights.do('key', fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flights.calls == {}
+
+    asyncio.run(main())
+
+def test_cancelled_awaiter_leaves_the_call_running():
+    flights = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def main():
+        first = asyncio.ensure_future(flights.do('key', compute))
+        second = asyncio.ensure_future(flights.do('key', compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 'done'
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+from models.downsampling import ohlc_records, iter_ohlc_records
+
+@pytest.fixture
+def records():
+    days = pd.bdate_range('2015-01-01', '2022-12-30')
+    return [{"issuer": "ALK", "date": day.strftime('%Y-%m-%d'), "last_trade_price": 100.0 + i % 37,
+             "max": 101.0 + i % 37, "min": 99.0 + i % 37, "volume": i, "turnover_best": 10 * i}
+            for i, day in enumerate(days)]
+
+def chunked(records, size):
+    return (records[i:i + size] for i in range(0, len(records), size))
+
+@pytest.mark.parametrize('max_points', [3, 10, 40, 120, 500, 5000])
+def test_streamed_bars_match_ohlc_records(records, max_points):
+    chunks = list(iter_ohlc_records(chunked(records, 500), max_points, '2022-12-31'))
+    assert [bar for chunk in chunks for bar in chunk] == ohlc_records(records, max_points)
+
+@pytest.mark.parametrize('max_points', [784, 1000])
+def test_weekdays_decide_the_period_like_ohlc_records(max_points):
+    # three years of trading days: 784 of them, but more than 1000 calendar days
+    days = pd.bdate_range('2020-01-01', periods=784)
+    assert (days[-1] - days[0]).days + 1 > 1000
+    records = [{"issuer": "ALK", "date": day.strftime('%Y-%m-%d'), "last_trade_price": 100.0 + i % 11,
+                "max": 101.0 + i % 11, "min": 99.0 + i % 11, "volume": i, "turnover_best": 10 * i}
+               for i, day in enumerate(days)]
+    streamed = [bar for chunk in iter_ohlc_records(chunked(records, 500), max_points, days[-1]) for bar in chunk]
+    # daily rows as they are on both paths, not weekly bars on the streamed one
+    assert streamed == ohlc_records(records, max_points) == records
+
+def test_weekend_rows_keep_the_bound():
+    # rows on every day: 1000 of them on only 714 weekdays, counting weekdays would send all of them
+    days = pd.date_range('2020-01-01', periods=1000)
+    records = [{"issuer": "ALK", "date": day.strftime('%Y-%m-%d'), "last_trade_price": 100.0 + i % 11,
+                "max": 101.0 + i % 11, "min": 99.0 + i % 11, "volume": i, "turnover_best": 10 * i}
+               for i, day in enumerate(days)]
+    streamed = [bar for chunk in iter_ohlc_records(chunked(records, 500), 800, days[-1]) for bar in chunk]
+    assert streamed == ohlc_records(records, 800)
+    assert len(streamed) <= 800
+
+def test_bars_are_sent_as_their_periods_close(records):
+    # weekly bars for eight years of rows, one batch per cursor chunk and the last week after them
+    chunks = list(iter_ohlc_records(chunked(records, 500), 500, '2022-12-31'))
+    assert len(chunks) == len(list(chunked(records, 500))) + 1
+    bars = [bar for chunk in chunks for bar in chunk]
+    assert len(bars) <= 500
+    assert {bar["date"] for bar in bars} <= {record["date"] for record in records}
+    assert sum(bar["volume"] for bar in bars) == sum(record["volume"] for record in records)
+
+def test_no_rows_no_chunks():
+    assert list(iter_ohlc_records(iter([]), 100, '2022-12-31')) == []
@@ -0,0 +1,40 @@
+import datetime
+import sqlite3
+import pytest
+from models.database_factory import DatabaseFactory
+from models.data_model import DataModel
+
+# the bars technical_analysis writes on 2026-10-17, a Saturday: weeks under their Sunday, months under their last day
+STORED_BARS = {
+    '1 Day': ['2026-10-14', '2026-10-15', '2026-10-16'],
+    '1 Week': ['2026-10-04', '2026-10-11', '2026-10-18'],
+    '1 Month': ['2026-08-31', '2026-09-30', '2026-10-31'],
+}
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    # DataModel opens updated_stocks_database.db in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(DatabaseFactory, '_instances', {})
+    conn = sqlite3.connect('updated_stocks_database.db')
+    with conn:
+        conn.execute('CREATE TABLE transactions(issuer TEXT, date DATE, last_trade_price REAL, max REAL, min REAL, '
+                     'volume INTEGER, turnover_best INTEGER, PRIMARY KEY (issuer, date))')
+        conn.execute('CREATE TABLE analysis_results(date DATE, issuer TEXT, time_period TEXT, last_trade_price FLOAT, '
+                     'RSI FLOAT, RSI_Signal TEXT, PRIMARY KEY (date, issuer, time_period))')
+        conn.executemany("INSERT INTO analysis_results VALUES (?, 'ALK', ?, 100.0, 50.0, 'Hold')",
+                         [(f'{date} 00:00:00', period) for period, dates in STORED_BARS.items() for date in dates])
+    conn.close()
+    return DataModel()
+
+@pytest.mark.parametrize('timeframe, period', [('D', '1 Day'), ('W', '1 Week'), ('M', '1 Month')])
+def test_to_inside_a_period_keeps_its_bar(model, timeframe, period):
+    signals = model.fetch_precomputed_signals('ALK', datetime.date(2026, 8, 1), datetime.date(2026, 10, 17),
+                                              timeframe=timeframe)
+    assert [signal['date'] for signal in signals] == STORED_BARS[period]
+    assert {signal['source'] for signal in signals} == {'precomputed'}
+
+def test_to_before_a_period_leaves_it_out(model):
+    signals = model.fetch_precomputed_signals('ALK', datetime.date(2026, 8, 1), datetime.date(2026, 10, 11),
+                                              timeframe='W')
+    assert [signal['date'] for signal in signals] == ['2026-10-04', '2026-10-11']
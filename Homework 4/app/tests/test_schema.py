@@ -0,0 +1,49 @@
+import sqlite3
+import pytest
+from models.schema import ensure_schema, check_query_plans
+
+# transactions as Homework 1's scraper creates it
+TRANSACTIONS = '''
+CREATE TABLE transactions(
+    issuer TEXT,
+    date DATE,
+    last_trade_price REAL,
+    max REAL,
+    min REAL,
+    volume INTEGER,
+    turnover_best INTEGER,
+    PRIMARY KEY (issuer, date)
+)
+'''
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'updated_stocks_database.db')
+    conn.execute(TRANSACTIONS)
+    with conn:
+        conn.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         [(issuer, f'2020-01-{day:02d}', 10.0 + day, 11.0 + day, 9.0 + day, 100, 1000)
+                          for issuer in ('ALK', 'KMB', 'TTK') for day in range(1, 29)])
+    yield conn
+    conn.close()
+
+def test_query_plans_use_their_indexes(conn):
+    ensure_schema(conn)
+    assert check_query_plans(conn) == []
+
+def test_plans_are_checked(conn):
+    # without the covering index the range scan only has the primary key, which check_query_plans reports
+    conn.execute('CREATE TABLE issuers(issuer TEXT PRIMARY KEY)')
+    problems = check_query_plans(conn)
+    assert len(problems) == 2
+    assert all('does not use transactions_issuer_date_covering' in problem for problem in problems)
+
+def test_issuers_filled_and_kept_in_sync(conn):
+    ensure_schema(conn)
+    assert [row[0] for row in conn.execute('SELECT issuer FROM issuers ORDER BY issuer')] == ['ALK', 'KMB', 'TTK']
+    with conn:
+        conn.execute("INSERT INTO transactions VALUES ('GRNT', '2020-02-01', 1, 1, 1, 1, 1)")
+    assert conn.execute("SELECT 1 FROM issuers WHERE issuer = 'GRNT'").fetchone() is not None
+    # applying it again is harmless
+    ensure_schema(conn)
+    assert check_query_plans(conn) == []
@@ -1,16 +1,118 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+import numpy as np
 import pandas as pd
 from ta.momentum import RSIIndicator
+import columnar
+import indicators
+from metrics import instrument, phase
 
 app = Flask(__name__)
+instrument(app) #request timing and /metrics
+
+# /process takes the daily prices (date, last_trade_price, and max/min for STOCH, WilliamsR and CCI)
+# either as JSON {"data": [rows]} or as packed columns with one row group per issuer.
+# Without indicator specs it returns RSI(14) and its signal. With specs, given as
+# {"indicators": [{"name": "RSI", "window": 14, "thresholds": [30, 70]}, {"name": "MACD"}], "timeframe": "W"}
+# in the JSON body or in the columnar header params, every indicator is computed over the same bars
+# and the response has a <column> and <column>_signal pair per spec next to date and last_trade_price.
+@app.errorhandler(ValueError)
+def bad_request(e):
+    return jsonify({'error': str(e)}), 400
 
 @app.route('/process', methods=['POST'])
 def process_signals():
-    raw_data = request.json['data']
+    if request.mimetype == columnar.CONTENT_TYPE:
+        # packed columns, possibly many issuers in one call
+        with phase('decode'):
+            payload = request.get_data()
+            columns, groups = columnar.decode(payload)
+            params = columnar.params(payload)
+        if not groups:
+            groups = [{"issuer": None, "rows": len(columns['date'])}]
+        if params.get('indicators'):
+            return indicator_response(columns, groups, params)
+        with phase('rsi'):
+            result_columns, result_groups = calculate_signals_columnar(columns, groups)
+        if columnar.CONTENT_TYPE in request.accept_mimetypes.values():
+            with phase('encode'):
+                body = columnar.encode(result_columns, result_groups)
+            return Response(body, mimetype=columnar.CONTENT_TYPE)
+        return jsonify({'signals': records_by_issuer(result_columns, result_groups)})
+    with phase('decode'):
+        raw_data = request.json['data']
+    if request.json.get('indicators'):
+        columns = {name: [row.get(name) for row in raw_data] for name in ('date', 'last_trade_price', 'max', 'min')
+                   if raw_data and name in raw_data[0]}
+        return indicator_response(columns, [{"issuer": None, "rows": len(raw_data)}], request.json)
     # Complex signal processing logic isolated here
-    processed_signals = calculate_signals(raw_data)
+    with phase('rsi'):
+        processed_signals = calculate_signals(raw_data)
     return jsonify({'signals': processed_signals})
 
+def indicator_response(columns, groups, params):
+    """Columns for the requested indicator specs, packed when the client accepts it"""
+    specs = indicators.parse_specs(params['indicators'])
+    if not len(columns.get('date', [])):
+        raise ValueError("No price rows to compute the indicators on")
+    timeframe = params.get('timeframe', 'D')
+    with phase('indicators'):
+        result_columns, result_groups = calculate_indicators_columnar(columns, groups, specs, timeframe)
+    response_params = {'indicators': specs, 'timeframe': timeframe}
+    if columnar.CONTENT_TYPE in request.accept_mimetypes.values():
+        with phase('encode'):
+            body = columnar.encode(result_columns, result_groups, params=response_params)
+        return Response(body, mimetype=columnar.CONTENT_TYPE)
+    # JSON has no NaN, the warm-up bars of an indicator are null
+    result_columns['date'] = result_columns['date'].astype(str)
+    return jsonify({**response_params, 'groups': result_groups, 'columns': {
+        name: [None if value != value else value for value in values.tolist()]
+        for name, values in result_columns.items()
+    }})
+
+def calculate_indicators_columnar(columns, groups, specs, timeframe='D'):
+    """Every spec over each issuer's bars, the bars' shared pieces are computed once per issuer"""
+    parts, result_groups = [], []
+    for issuer, group_columns in columnar.split_groups(columns, groups):
+        frame = indicators.bars(group_columns, timeframe)
+        part = {'date': frame.index.to_numpy().astype('datetime64[D]'),
+                'last_trade_price': frame['last_trade_price'].to_numpy()}
+        part.update(indicators.SharedFrame(frame).compute(specs))
+        parts.append(part)
+        result_groups.append({'issuer': issuer, 'rows': len(frame)})
+    result_columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    return result_columns, result_groups
+
+def calculate_rsi(prices, window=14):
+    """RSI and Buy/Sell/Hold signal arrays for one issuer's prices"""
+    rsi = RSIIndicator(close=pd.Series(prices, dtype='float64'), window=window).rsi().to_numpy()
+    signal = np.where(rsi < 30, 'Buy', np.where(rsi > 70, 'Sell', 'Hold'))
+    # Handle NaN values
+    return np.nan_to_num(rsi, nan=50.0), signal
+
+def calculate_signals_columnar(columns, groups):
+    rsi_parts, signal_parts = [], []
+    for _, group_columns in columnar.split_groups(columns, groups):
+        rsi, signal = calculate_rsi(group_columns['last_trade_price'])
+        rsi_parts.append(rsi)
+        signal_parts.append(signal)
+    result_columns = {
+        'date': columns['date'],
+        'last_trade_price': columns['last_trade_price'],
+        'RSI': np.concatenate(rsi_parts) if rsi_parts else np.empty(0),
+        'signal': np.concatenate(signal_parts) if signal_parts else np.empty(0, dtype=str),
+    }
+    return result_columns, groups
+
+def records_by_issuer(columns, groups):
+    records = {}
+    for issuer, group_columns in columnar.split_groups(columns, groups):
+        records[issuer] = [
+            {'date': str(date), 'last_trade_price': float(price), 'RSI': float(rsi), 'signal': str(signal)}
+            for date, price, rsi, signal in zip(group_columns['date'], group_columns['last_trade_price'],
+                                                group_columns['RSI'], group_columns['signal'])
+        ]
+    return records
+
 def calculate_signals(data):
     df = pd.DataFrame(data)
     # Ensure numeric type for calculations
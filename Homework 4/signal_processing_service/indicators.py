@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Indicators /process can compute, with their default window and Buy/Sell thresholds.
+# Oscillators signal Buy below the first threshold and Sell above the second; MACD signals on crossing
+# its signal line and SMA/EMA on the price crossing the average, so they take no thresholds.
+# STOCH, WilliamsR and CCI need the "max" and "min" columns as well as last_trade_price.
+INDICATORS = {
+    'RSI': {'window': 14, 'thresholds': (30, 70)},
+    'STOCH': {'window': 14, 'thresholds': (20, 80)},
+    'WilliamsR': {'window': 14, 'thresholds': (-80, -20)},
+    'CCI': {'window': 20, 'thresholds': (-100, 100)},
+    'MACD': {'window': (12, 26, 9)}, #fast, slow, signal line
+    'SMA': {'window': 20},
+    'EMA': {'window': 20},
+}
+# Bars the indicators are computed on: pandas frequency, None for the daily rows as they are
+TIMEFRAMES = {'D': None, 'W': 'W', 'M': 'ME'}
+CCI_CONSTANT = 0.015
+
+def parse_specs(specs):
+    """Check a list of {"name", "window", "thresholds", "column"} specs and fill in the defaults.
+    Raises ValueError for anything that can't be computed."""
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("indicators must be a non-empty list of specs")
+    parsed = []
+    for spec in specs:
+        spec = {"name": spec} if isinstance(spec, str) else spec
+        name = spec.get("name") if isinstance(spec, dict) else None
+        if name not in INDICATORS:
+            raise ValueError(f"Unknown indicator {name}. Use one of {', '.join(INDICATORS)}")
+        defaults = INDICATORS[name]
+        window = spec.get("window", defaults["window"])
+        windows = window if isinstance(window, (list, tuple)) else [window]
+        if len(windows) != len(np.atleast_1d(defaults["window"])) or \
+                not all(isinstance(w, int) and not isinstance(w, bool) and w >= 1 for w in windows):
+            raise ValueError(f"Invalid window for {name}: {window}")
+        resolved = {"name": name, "column": spec.get("column", name),
+                    "window": list(windows) if len(windows) > 1 else windows[0]}
+        if "thresholds" in defaults:
+            thresholds = spec.get("thresholds", defaults["thresholds"])
+            if not isinstance(thresholds, (list, tuple)) or len(thresholds) != 2 or \
+                    not all(isinstance(t, (int, float)) for t in thresholds) or thresholds[0] > thresholds[1]:
+                raise ValueError(f"Invalid thresholds for {name}: {thresholds}")
+            resolved["thresholds"] = list(thresholds)
+        elif "thresholds" in spec:
+            raise ValueError(f"{name} takes no thresholds")
+        parsed.append(resolved)
+    columns = [spec["column"] for spec in parsed]
+    if len(set(columns)) != len(columns) or {'date', 'last_trade_price'} & set(columns):
+        raise ValueError("Every indicator needs its own column name, set \"column\" to tell them apart")
+    return parsed
+
+def bars(columns, timeframe='D'):
+    """DataFrame of one issuer's price columns, resampled to weekly or monthly bars if asked"""
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe. Use one of {', '.join(TIMEFRAMES)}")
+    frame = pd.DataFrame({name: np.asarray(values, dtype='float64') for name, values in columns.items() if name != 'date'},
+                         index=pd.DatetimeIndex(np.asarray(columns['date'], dtype='datetime64[D]').astype('datetime64[ns]')))
+    freq = TIMEFRAMES[timeframe]
+    if freq is None:
+        return frame
+    aggregations = {'last_trade_price': 'last', 'max': 'max', 'min': 'min'}
+    return frame.resample(freq).agg({name: aggregations[name] for name in frame.columns if name in aggregations}) \
+        .dropna(subset=['last_trade_price'])
+
+class SharedFrame:
+    """One issuer's bars, with the pieces several indicators use (price changes, EMAs by span,
+    rolling means, highs and lows) computed once and reused"""
+    def __init__(self, frame):
+        self.frame = frame
+        self.close = frame['last_trade_price']
+        self.pieces = {}
+
+    def _shared(self, key, compute):
+        if key not in self.pieces:
+            self.pieces[key] = compute()
+        return self.pieces[key]
+
+    def column(self, name):
+        if name not in self.frame:
+            raise ValueError(f"The request has no {name} column")
+        return self.frame[name]
+
+    def diff(self):
+        return self._shared('diff', lambda: self.close.diff(1))
+
+    def ema(self, span):
+        return self._shared(('ema', span), lambda: self.close.ewm(span=span, min_periods=span, adjust=False).mean())
+
+    def mean(self, window):
+        return self._shared(('mean', window), lambda: self.close.rolling(window).mean())
+
+    def lowest(self, window):
+        return self._shared(('lowest', window), lambda: self.column('min').rolling(window).min())
+
+    def highest(self, window):
+        return self._shared(('highest', window), lambda: self.column('max').rolling(window).max())
+
+    def typical(self):
+        return self._shared('typical', lambda: (self.column('max') + self.column('min') + self.close) / 3.0)
+
+    # indicators, each returns (values, Buy/Sell/Hold labels)
+    def rsi(self, window, thresholds):
+        # Wilder smoothing, the same numbers as ta's RSIIndicator
+        diff = self.diff()
+        up = diff.where(diff > 0, 0.0)
+        down = -diff.where(diff < 0, 0.0)
+        ema_up = up.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+        ema_down = down.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(ema_down == 0, 100, 100 - (100 / (1 + ema_up / ema_down)))
+        rsi[ema_up.isna().to_numpy()] = np.nan
+        return rsi, oscillator_signal(rsi, thresholds)
+
+    def stoch(self, window, thresholds):
+        lowest, highest = self.lowest(window), self.highest(window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stoch = (100 * (self.close - lowest) / (highest - lowest)).to_numpy()
+        return stoch, oscillator_signal(stoch, thresholds)
+
+    def williams_r(self, window, thresholds):
+        lowest, highest = self.lowest(window), self.highest(window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            williams_r = (-100 * (highest - self.close) / (highest - lowest)).to_numpy()
+        return williams_r, oscillator_signal(williams_r, thresholds)
+
+    def cci(self, window, thresholds):
+        typical = self.typical().to_numpy()
+        mean = np.full(len(typical), np.nan)
+        mad = np.full(len(typical), np.nan)
+        if window <= len(typical):
+            windows = sliding_window_view(typical, window)
+            mean[window - 1:] = windows.mean(axis=1)
+            mad[window - 1:] = np.abs(windows - mean[window - 1:, None]).mean(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cci = (typical - mean) / (CCI_CONSTANT * mad)
+        return cci, oscillator_signal(cci, thresholds)
+
+    def macd(self, windows):
+        fast, slow, sign = windows
+        macd = self.ema(fast) - self.ema(slow)
+        signal_line = macd.ewm(span=sign, min_periods=sign, adjust=False).mean()
+        return macd.to_numpy(), crossing_signal(macd.to_numpy(), signal_line.to_numpy())
+
+    def sma(self, window):
+        sma = self.mean(window).to_numpy()
+        return sma, crossing_signal(self.close.to_numpy(), sma)
+
+    def ema_signal(self, window):
+        ema = self.ema(window).to_numpy()
+        return ema, crossing_signal(self.close.to_numpy(), ema)
+
+    def compute(self, specs):
+        """{column: values, column_signal: labels} for every parsed spec"""
+        columns = {}
+        for spec in specs:
+            name, window = spec["name"], spec["window"]
+            if name == 'MACD':
+                values, signal = self.macd(window)
+            elif name == 'SMA':
+                values, signal = self.sma(window)
+            elif name == 'EMA':
+                values, signal = self.ema_signal(window)
+            else:
+                method = {'RSI': self.rsi, 'STOCH': self.stoch, 'WilliamsR': self.williams_r, 'CCI': self.cci}[name]
+                values, signal = method(window, spec["thresholds"])
+            columns[spec["column"]] = np.asarray(values, dtype='float64')
+            columns[spec["column"] + '_signal'] = signal
+        return columns
+
+def oscillator_signal(values, thresholds):
+    """Buy below the lower threshold, Sell above the upper one, Hold otherwise and during the warm-up"""
+    return np.where(values < thresholds[0], 'Buy', np.where(values > thresholds[1], 'Sell', 'Hold'))
+
+def crossing_signal(values, reference):
+    """Buy while values are above reference, Sell while below"""
+    return np.where(values > reference, 'Buy', np.where(values < reference, 'Sell', 'Hold'))
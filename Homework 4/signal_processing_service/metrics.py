@@ -0,0 +1,128 @@
+import contextvars
+import threading
+import time
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+
+# Request latency and per-phase histograms for a Flask app, exposed as Prometheus text on /metrics.
+# instrument(app) times every request by route; code on the hot path wraps its steps in phase("name")
+# and each response lists its phases in a Server-Timing header as well.
+# Keep this file identical to app/models/metrics.py.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+current_route = contextvars.ContextVar('current_route', default='none')
+current_phases = contextvars.ContextVar('current_phases', default=None)
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {} #labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self.lock:
+            series = self.series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series_items = [(labels, list(series)) for labels, series in sorted(self.series.items())]
+        for labels, series in series_items:
+            label_text = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {series[-1]}')
+        return lines
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+request_duration = Histogram('http_request_duration_seconds', 'Request latency by route',
+                             ('method', 'route', 'status'))
+phase_duration = Histogram('request_phase_duration_seconds', 'Time spent in each phase of a request',
+                           ('route', 'phase'))
+collectors = [] #functions returning {metric name: value}, names ending in _total are counters, the rest gauges
+
+class phase:
+    """with phase("db_fetch"): ... records how long the block took for the current route"""
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        phase_duration.observe((current_route.get(), self.name), seconds)
+        phases = current_phases.get()
+        if phases is not None:
+            phases[self.name] = phases.get(self.name, 0.0) + seconds
+        return False
+
+def register_collector(function):
+    """Add values read at scrape time, e.g. client or cache statistics.
+    Values that only ever go up are counters and their names end in _total, like signal_client_calls_total."""
+    collectors.append(function)
+
+def render():
+    lines = request_duration.render() + phase_duration.render()
+    for function in collectors:
+        for name, value in function().items():
+            kind = 'counter' if name.endswith('_total') else 'gauge'
+            lines += [f"# TYPE {name} {kind}", f"{name} {float(value)}"]
+    return '\n'.join(lines) + '\n'
+
+def server_timing(phases, seconds):
+    """Server-Timing header value for a request's phases and its total time"""
+    timings = [f'{name};dur={duration * 1000:.2f}' for name, duration in (phases or {}).items()]
+    return ', '.join(timings + [f'total;dur={seconds * 1000:.2f}'])
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with every jsonify counted as the json_serialization phase"""
+    def response(self, *args, **kwargs):
+        with phase('json_serialization'):
+            return super().response(*args, **kwargs)
+
+def instrument(app):
+    """Time every request of app by route and serve the histograms on /metrics"""
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_tokens = (current_route.set(request.url_rule.rule if request.url_rule else 'unmatched'),
+                            current_phases.set({}))
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        route = current_route.get()
+        request_duration.observe((request.method, route, str(response.status_code)), seconds)
+        response.headers['Server-Timing'] = server_timing(current_phases.get(), seconds)
+        route_token, phases_token = g.pop('metrics_tokens')
+        current_route.reset(route_token)
+        current_phases.reset(phases_token)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus text exposition of the request and phase histograms"""
+        return Response(render(), content_type=CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,262 @@
+"""Offline benchmarks for the scraper, the database reads, the indicators and the API's signal-service hop.
+
+Everything runs on synthetic data in a temporary directory, nothing is fetched from mse.mk.
+Results are written as JSON so two commits can be compared:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+"""
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRAPER_DIR = os.path.join(ROOT, 'Homework 1')
+ANALYSIS_DIR = os.path.join(ROOT, 'Homework 3')
+APP_DIR = os.path.join(ROOT, 'Homework 4', 'app')
+SERVICE_DIR = os.path.join(ROOT, 'Homework 4', 'signal_processing_service')
+
+DB_NAME = 'updated_stocks_database.db' #every module opens this name relative to the working directory
+ISSUERS = ('ALK', 'KMB', 'TEL', 'STB', 'GRNT', 'MPT', 'TNB', 'REPL')
+HISTORY_DAYS = 3650
+RANGE_DAYS = (30, 365, 1825, 3650)
+INDICATOR_BARS = (250, 2500, 10000)
+PAGE_ROWS = (50, 365)
+
+def measure(function, repeat, warmup=1):
+    """Run function warmup + repeat times and summarize the timed runs in milliseconds"""
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings = np.array(timings)
+    return {
+        "runs": repeat,
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "min_ms": float(timings.min()),
+    }
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the modules' progress prints while timing"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def import_from(directory, module_name, alias=None):
+    """Import module_name from one of the homework directories, which are not packages"""
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    if alias is None:
+        return importlib.import_module(module_name)
+    spec = importlib.util.spec_from_file_location(alias, os.path.join(directory, f'{module_name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def synthetic_rows(issuer, days, seed):
+    """Scraper rows (issuer, date, price, max, min, volume, turnover) for a random walk ending today"""
+    rng = np.random.default_rng(seed)
+    close = np.round(1000 * np.exp(np.cumsum(rng.normal(0, 0.01, days))), 2)
+    spread = np.round(np.abs(rng.normal(0, 0.005, days)) * close, 2)
+    volume = rng.integers(1, 10000, days)
+    first_day = datetime.date.today() - datetime.timedelta(days=days)
+    return [
+        (issuer, first_day + datetime.timedelta(days=day), float(close[day]), float(close[day] + spread[day]),
+         float(close[day] - spread[day]), int(volume[day]), int(volume[day] * close[day]))
+        for day in range(days)
+    ]
+
+def history_page(rows, seed=0):
+    """A symbol history page shaped like mse.mk's, with its number formatting and skipped columns"""
+    headers = ['Date', 'Last trade price', 'Max', 'Min', 'Avg. Price', '%chg.', 'Volume',
+               'Turnover in BEST in denars', 'Total turnover in denars']
+    body = []
+    for _, date, price, high, low, volume, turnover in synthetic_rows('ALK', rows, seed):
+        cells = [f'{date.month}/{date.day}/{date.year}', f'{price:,.2f}', f'{high:,.2f}', f'{low:,.2f}',
+                 f'{price:,.2f}', '0.12', f'{volume:,}', f'{turnover:,}', '0']
+        body.append('<tr>' + ''.join(f'<td class="text-right">{cell}</td>' for cell in cells) + '</tr>')
+    return ('<html><head><title>History</title></head><body><div class="table-responsive">'
+            '<table id="resultsTable" class="table"><thead><tr>' + ''.join(f'<th>{header}</th>' for header in headers)
+            + '</tr></thead><tbody>' + '\n'.join(body) + '</tbody></table></div></body></html>')
+
+def bench_parse(scraper, repeat, pages_dir=None):
+    """parse_history_page, the part of get_data_for_issuer that runs after the response arrives"""
+    pages = {f'synthetic_{rows}_rows': history_page(rows) for rows in PAGE_ROWS}
+    if pages_dir:
+        for name in sorted(os.listdir(pages_dir)):
+            if name.endswith('.html'):
+                with open(os.path.join(pages_dir, name), encoding='utf-8') as f:
+                    pages[name] = f.read()
+    results = {}
+    for page_name, page_html in pages.items():
+        for extractor in scraper.TABLE_EXTRACTORS:
+            timing = measure(lambda: scraper.parse_history_page(page_html, 'ALK', extractor), repeat)
+            timing["rows"] = len(scraper.parse_history_page(page_html, 'ALK', extractor))
+            results[f'{page_name}/{extractor}'] = timing
+    return results
+
+def bench_write(scraper, repeat):
+    """write_to_db throughput into a fresh database, the database is kept for the read benchmarks"""
+    rows = [row for seed, issuer in enumerate(ISSUERS) for row in synthetic_rows(issuer, HISTORY_DAYS, seed)]
+    results = {}
+    batch = rows[:HISTORY_DAYS]
+    def write_batch():
+        scraper.write_to_db(batch) #INSERT OR REPLACE, so repeating it rewrites the same rows
+    timing = measure(write_batch, repeat)
+    timing["rows"] = len(batch)
+    timing["rows_per_second"] = len(batch) / (timing["mean_ms"] / 1000)
+    results["rewrite_one_issuer"] = timing
+    started = time.perf_counter()
+    scraper.write_to_db(rows)
+    seconds = time.perf_counter() - started
+    results["initial_load"] = {"rows": len(rows), "seconds": seconds, "rows_per_second": len(rows) / seconds}
+    return results
+
+def bench_read(model, repeat):
+    """fetch_stock_data_from_db for several range sizes, cold (cache cleared) and warm"""
+    results = {}
+    today = datetime.date.today()
+    for days in RANGE_DAYS:
+        from_date = today - datetime.timedelta(days=days)
+        def cold():
+            model.stock_data_cache.clear()
+            model.fetch_stock_data_from_db('ALK', from_date, today)
+        def warm():
+            model.fetch_stock_data_from_db('ALK', from_date, today)
+        results[f'{days}_days/cold'] = measure(cold, repeat)
+        results[f'{days}_days/warm'] = measure(warm, repeat)
+        results[f'{days}_days/cold']["rows"] = len(model.fetch_stock_data_from_db('ALK', from_date, today))
+    return results
+
+def bench_indicators(analysis, repeat):
+    """calculate_indicators_and_generate_signals on synthetic bars"""
+    engine = import_from(ANALYSIS_DIR, 'indicator_engine')
+    results = {}
+    for bars in INDICATOR_BARS:
+        df = engine.synthetic_prices(bars)
+        results[f'{bars}_bars'] = measure(lambda: analysis.calculate_indicators_and_generate_signals(df.copy()), repeat)
+    return results
+
+def bench_signal_service(model, repeat):
+    """DataModel.calculate_rsi_signals against the real service on a local port, columnar and JSON"""
+    from werkzeug.serving import make_server
+    service = import_from(SERVICE_DIR, 'app', alias='signal_service_app')
+    logging.getLogger('werkzeug').setLevel(logging.WARNING) #no log line per request
+    server = make_server('127.0.0.1', 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/process'
+    model.signal_client.url = url
+    results = {}
+    try:
+        today = datetime.date.today()
+        for days in RANGE_DAYS[1:]:
+            data = model.fetch_stock_data_from_db('ALK', today - datetime.timedelta(days=days), today)
+            results[f'{days}_days/columnar'] = measure(lambda: model.calculate_rsi_signals(data), repeat)
+            payload = {'data': [{"date": row["date"], "last_trade_price": row["last_trade_price"]} for row in data]}
+            results[f'{days}_days/json'] = measure(
+                lambda: model.signal_client.session.post(url, json=payload, timeout=10).json(), repeat)
+        results["circuit"] = model.signal_client.stats()["circuit"]
+    finally:
+        server.shutdown()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(repeat, pages_dir=None):
+    results = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "benchmarks": {},
+    }
+    benchmarks = results["benchmarks"]
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            with quiet():
+                scraper = import_from(SCRAPER_DIR, 'updated_homework')
+                scraper.DB_NAME = DB_NAME
+            benchmarks["parse_history_page"] = bench_parse(scraper, repeat, pages_dir)
+            with quiet():
+                benchmarks["write_to_db"] = bench_write(scraper, repeat)
+                analysis = import_from(ANALYSIS_DIR, 'technical_analysis')
+                benchmarks["calculate_indicators_and_generate_signals"] = bench_indicators(analysis, repeat)
+                os.environ['SIGNAL_SERVICE_URL'] = 'http://127.0.0.1:9' #replaced once the service is listening
+                # the API's indexes, applied by its deploy step in production
+                schema_conn = sqlite3.connect(DB_NAME)
+                import_from(APP_DIR, 'models.schema').ensure_schema(schema_conn)
+                schema_conn.close()
+                model = import_from(APP_DIR, 'models.data_model').DataModel()
+                benchmarks["fetch_stock_data_from_db"] = bench_read(model, repeat)
+                try:
+                    benchmarks["signal_service_round_trip"] = bench_signal_service(model, repeat)
+                except ImportError as e:
+                    benchmarks["signal_service_round_trip"] = {"skipped": str(e)} #ta not installed
+        finally:
+            os.chdir(working_dir)
+    return results
+
+def compare(before_path, after_path):
+    """Print every timing of two result files side by side, ratio above 1 means after is slower"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'benchmark':70} {'before ms':>10} {'after ms':>10} {'ratio':>7}")
+    for group, cases in after["benchmarks"].items():
+        for case, timing in cases.items():
+            old = before["benchmarks"].get(group, {}).get(case)
+            if not isinstance(timing, dict) or "mean_ms" not in timing or not isinstance(old, dict) or "mean_ms" not in old:
+                continue
+            print(f"{group + '/' + case:70} {old['mean_ms']:10.3f} {timing['mean_ms']:10.3f} "
+                  f"{timing['mean_ms'] / old['mean_ms']:7.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks, results are saved as JSON")
+    parser.add_argument('--output', default='benchmark-results.json', help="where to write the results")
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per case")
+    parser.add_argument('--pages', help="directory of saved MSE history pages (*.html) to parse as well")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run(args.repeat, args.pages)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for group, cases in results["benchmarks"].items():
+        for case, timing in cases.items():
+            if isinstance(timing, dict) and "mean_ms" in timing:
+                print(f"{group}/{case}: {timing['mean_ms']:.3f} ms")
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()